@@ -0,0 +1,27 @@
+"""Gunicorn settings for the web service.
+
+Run from the repository (or /app in the container) root:
+    gunicorn -c gunicorn_conf.py web_server:app
+"""
+import os
+
+bind = os.environ.get("WEB_BIND", "0.0.0.0:5000")
+pythonpath = "src"
+
+# Timelapse job status lives in process memory, so keep a single worker
+# process and get concurrency from threads (serving files is I/O bound).
+workers = int(os.environ.get("WEB_WORKERS", "1"))
+worker_class = os.environ.get("WEB_WORKER_CLASS", "gthread")
+threads = int(os.environ.get("WEB_THREADS", "8"))
+# Only used by event-loop workers (WEB_WORKER_CLASS=gevent, needs the gevent
+# package): long zip downloads and slow clients then cost a greenlet rather
+# than one of the `threads`.
+worker_connections = int(os.environ.get("WEB_WORKER_CONNECTIONS", "1000"))
+keepalive = 15
+# send_file responses go out through wsgi.file_wrapper -> sendfile(2)
+sendfile = True
+# synchronous POST /timelapse can run for a long time
+timeout = int(os.environ.get("WEB_TIMEOUT", "3600"))
+
+accesslog = "-"
+loglevel = os.environ.get("LOG_LEVEL", "info").lower()
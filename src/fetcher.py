@@ -8,15 +8,20 @@ or max age (days).
 Configuration via environment variables (see README and config.example.env).
 """
 import os
+import re
 import sys
 import time
 import logging
 import shutil
+import heapq
+import random
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from pathlib import Path
-from typing import Optional
+from typing import Callable, Iterable, Optional
 
 import requests
+from requests.adapters import HTTPAdapter
 
 # Defaults
 IMAGE_URL = os.environ.get("IMAGE_URL")
@@ -30,6 +35,13 @@ MAX_AGE_DAYS = int(os.environ.get("MAX_AGE_DAYS", "0"))  # 0 = disabled
 TIMEOUT_SECONDS = int(os.environ.get("TIMEOUT_SECONDS", "15"))
 RETRY_COUNT = int(os.environ.get("RETRY_COUNT", "3"))
 RETRY_BACKOFF_FACTOR = float(os.environ.get("RETRY_BACKOFF_FACTOR", "1.5"))
+MAX_BACKOFF_SECONDS = float(os.environ.get("MAX_BACKOFF_SECONDS", "60"))
+_BACKOFF = [RETRY_BACKOFF_FACTOR ** i for i in range(RETRY_COUNT + 2)]
+# fsync each image (and its directory) so a power loss can't leave empty files
+FSYNC_ON_WRITE = os.environ.get("FSYNC_ON_WRITE", "1").lower() in ("1", "true", "yes")
+# Send If-None-Match/If-Modified-Since and skip saving on 304. Off by default:
+# an unchanged scene (e.g. at night) then produces no frame for the timelapse.
+CONDITIONAL_GET = os.environ.get("CONDITIONAL_GET", "0").lower() in ("1", "true", "yes")
 
 LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")
 
@@ -37,20 +49,36 @@ logging.basicConfig(stream=sys.stdout, level=LOG_LEVEL,
                     format="%(asctime)s %(levelname)s %(message)s")
 logger = logging.getLogger("fetcher")
 
+# Shared HTTP session so repeated fetches (and retries) to the same camera host
+# reuse the keep-alive TCP/TLS connection instead of reconnecting every cycle.
+SESSION = requests.Session()
+SESSION.headers["User-Agent"] = "byggeplasskamera-fetcher"
+_adapter = HTTPAdapter(pool_connections=32, pool_maxsize=32, max_retries=0)
+SESSION.mount("http://", _adapter)
+SESSION.mount("https://", _adapter)
+
+
+# url -> {"etag", "last_modified"} of the last saved image, for CONDITIONAL_GET
+_VALIDATORS: dict = {}
+# returned by try_fetch when the server answers 304 Not Modified
+NOT_MODIFIED = object()
+
+# storage dir -> time.time() of its last retention-by-age pass
+_LAST_AGE_CHECK: dict = {}
+AGE_CHECK_INTERVAL_SECONDS = 3600
+
 
 def ensure_storage_dir(path: Path) -> None:
     path.mkdir(parents=True, exist_ok=True)
 
 
+# Unicode-aware like str.isalnum(), so existing ids such as "bryggeløkka" keep their dirs
+_SLUG_RE = re.compile(r"[^\w-]")
+
+
 def slugify_id(s: str) -> str:
     # simple slug: allow alnum, dash, underscore; convert others to '_'
-    out = []
-    for ch in s:
-        if ch.isalnum() or ch in ("-", "_"):
-            out.append(ch)
-        else:
-            out.append("_")
-    return "".join(out)
+    return _SLUG_RE.sub("_", s)
 
 
 def parse_sources() -> list:
@@ -117,55 +145,217 @@ def filename_for_ts(ts: datetime, ext: str) -> str:
     return ts.strftime("%Y%m%d_%H%M%S") + ext
 
 
-def save_image(content: bytes, path: Path) -> None:
+def fsync_dir(path: Path) -> None:
+    # Directory fsync makes the rename itself durable; not supported on Windows.
+    if os.name == "nt":
+        return
+    dfd = os.open(str(path), os.O_RDONLY)
+    try:
+        os.fsync(dfd)
+    finally:
+        os.close(dfd)
+
+
+def save_image(chunks: Iterable[bytes], path: Path, fsync: Optional[bool] = None) -> int:
+    """Write chunks to ``path`` atomically and return the number of bytes written.
+
+    Raises ValueError (leaving nothing behind) if the body turned out empty;
+    if reading ``chunks`` fails, the partial file is removed and the error re-raised.
+    With ``fsync`` (default FSYNC_ON_WRITE) the data and the rename are flushed
+    to disk before returning.
+    """
+    if fsync is None:
+        fsync = FSYNC_ON_WRITE
     tmp = path.with_suffix(path.suffix + ".tmp")
-    with open(tmp, "wb") as f:
-        f.write(content)
+    written = 0
+    try:
+        with open(tmp, "wb", buffering=1 << 20) as f:
+            for chunk in chunks:
+                if chunk:
+                    f.write(chunk)
+                    written += len(chunk)
+            if fsync and written:
+                f.flush()
+                os.fsync(f.fileno())
+    except BaseException:
+        # a body cut off mid-stream must not leave a partial .tmp behind
+        tmp.unlink(missing_ok=True)
+        raise
+    if not written:
+        tmp.unlink(missing_ok=True)
+        raise ValueError(f"empty response body for {path.name}")
     # atomic rename
     tmp.replace(path)
+    if fsync:
+        fsync_dir(path.parent)
+    return written
+
+
+def update_latest(sdir: Path, dest: Path) -> None:
+    """Point ``sdir/latest`` at ``dest``.
+
+    Prefers a relative symlink; where the filesystem has no symlinks, a
+    hardlink (same inode, no data copied; always the same filesystem since
+    both live in ``sdir``), and only as a last resort a full copy.
+    """
+    latest = sdir / "latest"
+    latest.unlink(missing_ok=True)
+    try:
+        latest.symlink_to(dest.name)
+        return
+    except OSError:
+        pass
+    try:
+        os.link(dest, latest)
+        return
+    except OSError:
+        pass
+    shutil.copy2(dest, latest)
 
 
 def rotate_storage(storage: Path, max_files: int = 0, max_age_days: int = 0) -> None:
-    files = sorted([p for p in storage.iterdir() if p.is_file() and p.name != "latest"])
-    # remove by count
-    if max_files and len(files) > max_files:
-        to_remove = files[: len(files) - max_files]
-        for p in to_remove:
+    if not max_files and not max_age_days:
+        return
+    # Age limits are in days, so the age pass only needs to run about hourly.
+    now = time.time()
+    check_age = bool(max_age_days) and now - _LAST_AGE_CHECK.get(str(storage), 0.0) >= AGE_CHECK_INTERVAL_SECONDS
+    if not max_files and not check_age:
+        return
+    # scandir entries carry d_type and cache stat(), so each file costs at most
+    # one syscall; names are timestamps, so ordering by name is chronological.
+    with os.scandir(storage) as it:
+        entries = [e for e in it if e.name != "latest" and e.is_file(follow_symlinks=False)]
+    # decide everything first (path -> (name, reason)), then unlink in one burst
+    doomed = {}
+    if max_files and len(entries) > max_files:
+        for e in heapq.nsmallest(len(entries) - max_files, entries, key=lambda e: e.name):
+            doomed[e.path] = (e.name, "count")
+    if check_age:
+        _LAST_AGE_CHECK[str(storage)] = now
+        cutoff = now - timedelta(days=max_age_days).total_seconds()
+        for e in entries:
+            if e.path in doomed:
+                continue
             try:
-                p.unlink()
-                logger.info("Removed old file (count): %s", p.name)
+                if e.stat().st_mtime < cutoff:
+                    doomed[e.path] = (e.name, "age")
             except Exception:
-                logger.exception("Failed to remove %s", p)
-    # remove by age
-    if max_age_days:
-        cutoff = datetime.utcnow() - timedelta(days=max_age_days)
-        for p in files:
-            try:
-                mtime = datetime.utcfromtimestamp(p.stat().st_mtime)
-                if mtime < cutoff:
-                    p.unlink()
-                    logger.info("Removed old file (age): %s", p.name)
-            except Exception:
-                logger.exception("Failed to check/remove %s", p)
+                logger.exception("Failed to check %s", e.path)
+    for path, (name, reason) in doomed.items():
+        try:
+            os.unlink(path)
+            logger.info("Removed old file (%s): %s", reason, name)
+        except Exception:
+            logger.exception("Failed to remove %s", path)
 
 
-def try_fetch(url: str, timeout: int, retries: int, backoff: float) -> Optional[requests.Response]:
+def backoff_delay(attempt: int, backoff: float = RETRY_BACKOFF_FACTOR) -> float:
+    """Seconds to wait before retry ``attempt``: backoff**attempt plus up to 10% jitter.
+
+    The jitter keeps sources that share a backend from retrying in lockstep.
+    """
+    if backoff == RETRY_BACKOFF_FACTOR and attempt < len(_BACKOFF):
+        base = _BACKOFF[attempt]
+    else:
+        base = backoff ** attempt
+    return min(base + random.uniform(0, base * 0.1), MAX_BACKOFF_SECONDS)
+
+
+def conditional_headers(url: str) -> dict:
+    """If-None-Match / If-Modified-Since headers from the last saved image of ``url``."""
+    validators = _VALIDATORS.get(url, {})
+    headers = {}
+    if validators.get("etag"):
+        headers["If-None-Match"] = validators["etag"]
+    if validators.get("last_modified"):
+        headers["If-Modified-Since"] = validators["last_modified"]
+    return headers
+
+
+def remember_validators(url: str, resp: requests.Response) -> None:
+    _VALIDATORS[url] = {
+        "etag": resp.headers.get("ETag"),
+        "last_modified": resp.headers.get("Last-Modified"),
+    }
+
+
+def try_fetch(url: str, timeout: int, retries: int, backoff: float,
+              session: Optional[requests.Session] = None,
+              headers: Optional[dict] = None,
+              consume: Optional[Callable[[requests.Response], object]] = None) -> object:
+    """GET ``url`` with retries.
+
+    Returns the (streaming) response, NOT_MODIFIED if the server answered 304
+    to conditional ``headers``, or None if all attempts failed. With
+    ``consume``, the body is handed to ``consume(resp)`` inside the retry loop
+    and its result is returned instead; a body that fails to download
+    (RequestException) or turns out empty (ValueError) counts as a failed attempt.
+    """
+    session = session or SESSION
     attempt = 0
     while attempt <= retries:
         try:
-            resp = requests.get(url, timeout=timeout)
-            if resp.status_code == 200 and resp.content:
-                return resp
+            # stream=True: only headers are read here, the body is streamed to
+            # disk by save_image so it is never held in memory as a whole.
+            resp = session.get(url, timeout=timeout, stream=True, headers=headers)
+            if resp.status_code == 200 and resp.headers.get("content-length") != "0":
+                if consume is None:
+                    return resp
+                with resp:
+                    return consume(resp)
+            resp.close()
+            if resp.status_code == 304 and headers:
+                return NOT_MODIFIED
             logger.warning("Non-200 status %s from %s", resp.status_code, url)
         except requests.RequestException:
             logger.exception("Request failed (attempt %d) for %s", attempt + 1, url)
+        except ValueError as e:
+            logger.warning("%s (attempt %d) from %s", e, attempt + 1, url)
         attempt += 1
-        sleep = backoff ** attempt
+        if attempt > retries:
+            break
+        sleep = backoff_delay(attempt, backoff)
         logger.debug("Sleeping %.1f seconds before retry", sleep)
         time.sleep(sleep)
     return None
 
 
+def process_source(s: dict) -> None:
+    """Fetch one source and store the image; errors are logged, never raised."""
+    sid = s["id"]
+    url = s["url"]
+    sdir = s["dir"]
+
+    def store(resp: requests.Response) -> Path:
+        ext = guess_extension(resp, url)
+        ts = datetime.utcnow()
+        fname = filename_for_ts(ts, ext)
+        dest = sdir / fname
+        save_image(resp.iter_content(chunk_size=65536), dest)
+        if CONDITIONAL_GET:
+            remember_validators(url, resp)
+        return dest
+
+    try:
+        headers = conditional_headers(url) if CONDITIONAL_GET else None
+        dest = try_fetch(url, timeout=TIMEOUT_SECONDS, retries=RETRY_COUNT, backoff=RETRY_BACKOFF_FACTOR,
+                         headers=headers, consume=store)
+        if dest is NOT_MODIFIED:
+            logger.info("[%s] Image not modified, nothing saved", sid)
+        elif dest is not None:
+            logger.info("[%s] Saved image: %s", sid, dest.name)
+            try:
+                update_latest(sdir, dest)
+            except Exception:
+                logger.exception("[%s] Failed to update latest link/file", sid)
+            # retention
+            rotate_storage(sdir, max_files=MAX_FILES, max_age_days=MAX_AGE_DAYS)
+        else:
+            logger.warning("[%s] Failed to fetch image after retries", sid)
+    except Exception:
+        logger.exception("[%s] Failed processing source %s", sid, url)
+
+
 def main() -> int:
     sources = parse_sources()
     if not sources:
@@ -179,45 +369,24 @@ def main() -> int:
     logger.info("Starting image fetcher. sources=%s interval=%ds storage_root=%s", \
                 ",".join([f"{s['id']}={s['url']}" for s in sources]), INTERVAL_SECONDS, STORAGE_ROOT)
 
+    # Fetching is I/O bound: run all sources of a cycle concurrently so the
+    # cycle takes as long as the slowest camera rather than the sum of all.
+    executor = ThreadPoolExecutor(max_workers=min(len(sources), 32), thread_name_prefix="fetch")
+
+    # Schedule against absolute ticks on the monotonic clock so the capture
+    # cadence neither drifts with cycle time nor jumps with wall-clock changes.
+    next_fire = time.monotonic()
     while True:
-        start = time.time()
-        # iterate through sources and fetch each once per cycle
-        for s in sources:
-            sid = s["id"]
-            url = s["url"]
-            sdir = s["dir"]
-            try:
-                resp = try_fetch(url, timeout=TIMEOUT_SECONDS, retries=RETRY_COUNT, backoff=RETRY_BACKOFF_FACTOR)
-                if resp is not None:
-                    ext = guess_extension(resp, url)
-                    ts = datetime.utcnow()
-                    fname = filename_for_ts(ts, ext)
-                    dest = sdir / fname
-                    save_image(resp.content, dest)
-                    logger.info("[%s] Saved image: %s", sid, dest.name)
-                    # update latest symlink
-                    latest = sdir / "latest"
-                    try:
-                        if latest.exists() or latest.is_symlink():
-                            latest.unlink()
-                        latest.symlink_to(dest.name)
-                    except Exception:
-                        # If symlink not supported on FS, copy
-                        try:
-                            shutil.copy2(dest, sdir / "latest")
-                        except Exception:
-                            logger.exception("[%s] Failed to update latest link/file", sid)
-                    # retention
-                    rotate_storage(sdir, max_files=MAX_FILES, max_age_days=MAX_AGE_DAYS)
-                else:
-                    logger.warning("[%s] Failed to fetch image after retries", sid)
-            except Exception:
-                logger.exception("[%s] Failed processing source %s", sid, url)
+        list(executor.map(process_source, sources))
 
-        elapsed = time.time() - start
-        sleep_for = INTERVAL_SECONDS - elapsed
-        if sleep_for > 0:
-            time.sleep(sleep_for)
+        next_fire += INTERVAL_SECONDS
+        delay = next_fire - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        else:
+            # skip missed ticks instead of firing a burst of catch-up cycles
+            logger.warning("Fetch cycle overran the interval by %.1fs", -delay)
+            next_fire = time.monotonic()
 
 
 if __name__ == "__main__":
@@ -5,14 +5,43 @@ import sys
 import subprocess
 import logging
 import tempfile
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from datetime import datetime
+from functools import lru_cache
+from typing import Optional
 
 # Requires: ffmpeg, PIL/Pillow
 
 logging.basicConfig(level="INFO", format="%(asctime)s %(levelname)s %(message)s")
 logger = logging.getLogger("timelapse")
 
+IMAGE_EXTS = frozenset({".jpg", ".jpeg", ".png", ".gif", ".webp"})
+# str.endswith() takes a tuple and checks it in C, several times faster per
+# name than os.path.splitext() plus a set lookup
+_IMAGE_SUFFIXES = tuple(IMAGE_EXTS)
+FONT_PATH = "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf"
+LABEL_FONT_SIZE = 20
+LABEL_MARGIN = 10
+# Raw frames labeled ahead of ffmpeg sit in memory; cap them by size, since a
+# 4K RGB frame alone is ~25 MB
+FRAME_BUFFER_BYTES = 256 * 1024 * 1024
+
+# Symlink in the image directory naming the newest timelapse written there, so
+# readers (the web UI) need not stat every video to find it
+LATEST_TIMELAPSE_LINK = "latest_timelapse.mp4"
+
+# H.264 encoder: "auto" picks a working hardware encoder and falls back to libx264
+VIDEO_ENCODER = os.environ.get("VIDEO_ENCODER", "auto")
+X264_PRESET = os.environ.get("X264_PRESET", "veryfast")
+
+# Hardware encoders that accept ordinary (system memory) frames, in order of preference
+_HW_ENCODER_ARGS = {
+    "h264_nvenc": ["-preset", "p4", "-rc", "vbr", "-cq", "23"],
+    "h264_qsv": ["-global_quality", "23"],
+    "h264_videotoolbox": ["-q:v", "60"],
+}
+
 
 def generate_timelapse(
     image_dir: Path,
@@ -43,16 +72,19 @@ def generate_timelapse(
         logger.error("Image directory does not exist: %s", image_dir)
         return False
     
-    # Get all image files, filter by date if provided
-    images = sorted([
-        p for p in image_dir.iterdir()
-        if p.is_file() and p.suffix.lower() in (".jpg", ".jpeg", ".png", ".gif", ".webp")
-    ])
-    
+    # Get all image files, filter by date if provided. Work on plain names from
+    # scandir (file type comes from the dirent) and build Paths only at the end.
+    with os.scandir(image_dir) as it:
+        names = sorted(
+            e.name for e in it
+            if e.name.lower().endswith(_IMAGE_SUFFIXES) and e.is_file(follow_symlinks=False)
+        )
+
     if start_date:
-        images = [p for p in images if p.stem >= start_date]
+        names = [n for n in names if os.path.splitext(n)[0] >= start_date]
     if end_date:
-        images = [p for p in images if p.stem <= end_date]
+        names = [n for n in names if os.path.splitext(n)[0] <= end_date]
+    images = [image_dir / n for n in names]
     
     if not images:
         logger.error("No images found in %s (filtered)", image_dir)
@@ -62,20 +94,105 @@ def generate_timelapse(
     
     # If text overlay is requested, use ffmpeg with a text drawtext filter
     if add_text_overlay:
-        return _generate_with_overlay(images, output_path, fps)
+        success = _generate_with_overlay(images, output_path, fps)
     else:
-        return _generate_without_overlay(images, output_path, fps)
+        success = _generate_without_overlay(images, output_path, fps)
+    if success and os.path.samefile(output_path.parent, image_dir):
+        update_latest_timelapse(output_path)
+    return success
 
 
-def _generate_without_overlay(images: list, output_path: Path, fps: int) -> bool:
-    """Generate video without text overlay using concat demuxer."""
+def update_latest_timelapse(output_path: Path) -> None:
+    """Atomically point LATEST_TIMELAPSE_LINK next to ``output_path`` at it."""
+    link = output_path.parent / LATEST_TIMELAPSE_LINK
+    tmp = link.with_name(link.name + ".tmp")
+    try:
+        if os.path.lexists(tmp):
+            os.unlink(tmp)
+        os.symlink(output_path.name, tmp)
+        os.replace(tmp, link)
+    except OSError:
+        logger.exception("Failed to update %s", link)
+
+
+def _write_concat_file(images: list, fps: int, with_filename_metadata: bool = False) -> str:
+    """Write an ffmpeg concat-demuxer list showing each image for one frame.
+
+    With ``with_filename_metadata`` every entry also carries a ``filename``
+    packet metadata value that filters (drawtext) can read per frame.
+    """
+    duration = 1 / fps  # each image shown for 1 frame
     with tempfile.NamedTemporaryFile(mode="w", suffix=".txt", delete=False) as f:
         for img in images:
-            duration = 1 / fps  # each image shown for 1 frame
             f.write(f"file '{img.absolute()}'\n")
+            if with_filename_metadata:
+                f.write(f"file_packet_metadata filename={img.name}\n")
             f.write(f"duration {duration}\n")
-        concat_file = f.name
-    
+        return f.name
+
+
+@lru_cache(maxsize=None)
+def _ffmpeg_has_filter(name: str) -> bool:
+    """Return True if the installed ffmpeg provides the given video filter."""
+    try:
+        result = subprocess.run(
+            ["ffmpeg", "-hide_banner", "-filters"], capture_output=True, text=True, check=False
+        )
+    except OSError:
+        return False
+    return any(line.split()[1:2] == [name] for line in result.stdout.splitlines())
+
+
+@lru_cache(maxsize=1)
+def _detect_hw_encoder() -> Optional[str]:
+    """Return the first hardware H.264 encoder that can actually encode here.
+
+    Distro ffmpeg builds list nvenc/qsv even without the hardware, so each
+    candidate is checked with a one-frame test encode.
+    """
+    try:
+        listed = subprocess.run(
+            ["ffmpeg", "-hide_banner", "-encoders"], capture_output=True, text=True, check=False
+        ).stdout
+    except OSError:
+        return None
+    for name, args in _HW_ENCODER_ARGS.items():
+        if f" {name} " not in listed:
+            continue
+        probe = [
+            "ffmpeg", "-hide_banner", "-loglevel", "error",
+            "-f", "lavfi", "-i", "color=size=256x256",
+            "-frames:v", "1", "-c:v", name, *args, "-f", "null", "-",
+        ]
+        if subprocess.run(probe, capture_output=True, check=False).returncode == 0:
+            logger.info("Using hardware encoder %s", name)
+            return name
+    return None
+
+
+def _encoder_args() -> list:
+    """ffmpeg video codec arguments for the configured encoder."""
+    encoder = VIDEO_ENCODER
+    if encoder == "auto":
+        encoder = _detect_hw_encoder() or "libx264"
+    if encoder == "libx264":
+        return ["-c:v", "libx264", "-preset", X264_PRESET]
+    return ["-c:v", encoder, *_HW_ENCODER_ARGS.get(encoder, [])]
+
+
+def _run_ffmpeg(cmd: list, output_path: Path) -> bool:
+    logger.info("Running: %s", " ".join(cmd))
+    result = subprocess.run(cmd, capture_output=True, text=True, check=False)
+    if result.returncode != 0:
+        logger.error("ffmpeg failed: %s", result.stderr)
+        return False
+    logger.info("Timelapse video created: %s", output_path)
+    return True
+
+
+def _generate_without_overlay(images: list, output_path: Path, fps: int) -> bool:
+    """Generate video without text overlay using concat demuxer."""
+    concat_file = _write_concat_file(images, fps)
     try:
         cmd = [
             "ffmpeg",
@@ -83,114 +200,183 @@ def _generate_without_overlay(images: list, output_path: Path, fps: int) -> bool
             "-safe", "0",
             "-i", concat_file,
             "-vf", f"fps={fps}",
-            "-c:v", "libx264",
+            *_encoder_args(),
             "-pix_fmt", "yuv420p",
             "-y",
             str(output_path),
         ]
-        logger.info("Running: %s", " ".join(cmd))
-        result = subprocess.run(cmd, capture_output=True, text=True, check=False)
-        if result.returncode != 0:
-            logger.error("ffmpeg failed: %s", result.stderr)
-            return False
-        logger.info("Timelapse video created: %s", output_path)
-        return True
+        return _run_ffmpeg(cmd, output_path)
     finally:
         Path(concat_file).unlink(missing_ok=True)
 
 
 def _generate_with_overlay(images: list, output_path: Path, fps: int) -> bool:
-    """Generate video with filename overlay in bottom-left corner."""
-    # Use ffmpeg with a complex filter that draws the filename on each frame
-    # We'll use the image sequence directly and apply text filter
-    
-    # Sort images and build input
-    first_image = images[0]
-    
-    # Build a filtergraph with drawtext for each image
-    # For simplicity, we'll use a single drawtext that references the input filename
-    # FFmpeg's drawtext supports the metadata field 'lavfi.source.filename' but that's tricky
-    # Alternative: use a script to generate labeled images, or use complex filter
-    
-    # Simpler approach: use imageclip in Python or just concat without overlay
-    # For maximum compatibility, let's generate labeled images first
-    
+    """Generate video with filename overlay in bottom-left corner.
+
+    Prefers a single ffmpeg pass with the drawtext filter; falls back to
+    labeling frames with Pillow when ffmpeg lacks drawtext (no libfreetype)
+    or the font is missing.
+    """
+    if _ffmpeg_has_filter("drawtext") and Path(FONT_PATH).exists():
+        return _generate_with_drawtext(images, output_path, fps)
+    logger.info("ffmpeg drawtext unavailable, labeling frames with Pillow")
+    return _generate_with_pil_overlay(images, output_path, fps)
+
+
+def _generate_with_drawtext(images: list, output_path: Path, fps: int) -> bool:
+    """Draw each frame's filename with ffmpeg drawtext: one decode, one encode."""
+    concat_file = _write_concat_file(images, fps, with_filename_metadata=True)
+    drawtext = (
+        f"drawtext=fontfile={FONT_PATH}"
+        r":text='%{metadata\:filename}'"
+        f":x={LABEL_MARGIN}:y=h-th-{LABEL_MARGIN}:fontsize={LABEL_FONT_SIZE}:fontcolor=white"
+        ":box=1:boxcolor=black@0.8:boxborderw=2"
+    )
     try:
-        from PIL import Image, ImageDraw, ImageFont
-    except ImportError:
-        logger.error("PIL/Pillow not installed. Cannot add text overlay. Use: pip install Pillow")
-        return _generate_without_overlay(images, output_path, fps)
-    
-    with tempfile.TemporaryDirectory() as tmpdir:
-        tmpdir = Path(tmpdir)
-        logger.info("Creating labeled images in temporary directory")
-        
-        # Copy/overlay text on each image
-        for idx, img_path in enumerate(images):
-            try:
-                img = Image.open(img_path)
-                # Ensure image is RGB for JPEG
-                if img.mode != "RGB":
-                    img = img.convert("RGB")
-                draw = ImageDraw.Draw(img)
-                
-                # Try to load a font; fallback to default if not available
-                try:
-                    font = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf", 20)
-                except (IOError, OSError):
-                    font = ImageFont.load_default()
-                
-                # Draw filename in bottom-left corner with semi-transparent background
-                text = img_path.name
-                text_bbox = draw.textbbox((0, 0), text, font=font)
-                text_width = text_bbox[2] - text_bbox[0]
-                text_height = text_bbox[3] - text_bbox[1]
-                
-                margin = 10
-                img_width, img_height = img.size
-                x = margin
-                y = img_height - text_height - margin
-                
-                # Semi-transparent black background for text
-                bg_coords = [(x - 2, y - 2), (x + text_width + 2, y + text_height + 2)]
-                draw.rectangle(bg_coords, fill=(0, 0, 0, 200))
-                
-                # Draw text
-                draw.text((x, y), text, fill=(255, 255, 255, 255), font=font)
-                
-                # Save to temp directory
-                # Save with a pure sequential numeric filename so ffmpeg can use %06d
-                labeled_path = tmpdir / f"{idx:06d}.jpg"
-                img.save(labeled_path, "JPEG")
-                
-                if (idx + 1) % 100 == 0:
-                    logger.info("Labeled %d / %d images", idx + 1, len(images))
-                    
-            except Exception as e:
-                logger.exception("Failed to label image %s", img_path)
-                return False
-        
-        logger.info("All %d images labeled. Creating video...", len(images))
-
-        # Use numeric sequence input (%06d.jpg)
-        pattern = str(tmpdir / "%06d.jpg")
         cmd = [
             "ffmpeg",
-            "-framerate", str(fps),
-            "-i", pattern,
-            "-c:v", "libx264",
+            "-f", "concat",
+            "-safe", "0",
+            "-i", concat_file,
+            "-vf", f"{drawtext},fps={fps}",
+            *_encoder_args(),
             "-pix_fmt", "yuv420p",
             "-y",
             str(output_path),
         ]
-        logger.info("Running: %s", " ".join(cmd))
-        result = subprocess.run(cmd, capture_output=True, text=True, check=False)
-        if result.returncode != 0:
-            logger.error("ffmpeg failed: %s", result.stderr)
+        return _run_ffmpeg(cmd, output_path)
+    finally:
+        Path(concat_file).unlink(missing_ok=True)
+
+
+@lru_cache(maxsize=1)
+def _get_font():
+    """Load the overlay font once per process (parsing the TTF is not free)."""
+    from PIL import ImageFont
+
+    # Try to load a font; fallback to default if not available
+    try:
+        return ImageFont.truetype(FONT_PATH, LABEL_FONT_SIZE)
+    except (IOError, OSError):
+        return ImageFont.load_default()
+
+
+def _label_one(job: tuple) -> Optional[bytes]:
+    """Draw the filename onto one image and return it as raw RGB24 bytes.
+
+    Frames whose size differs from the video size are resized to it.
+    Top-level so it can be pickled for ProcessPoolExecutor workers.
+    """
+    from PIL import Image, ImageDraw
+
+    img_path, size = job
+    try:
+        img = Image.open(img_path)
+        # rawvideo input is rgb24
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+        if img.size != size:
+            img = img.resize(size)
+        draw = ImageDraw.Draw(img)
+        font = _get_font()
+
+        # Draw filename in bottom-left corner with semi-transparent background
+        text = img_path.name
+        text_bbox = draw.textbbox((0, 0), text, font=font)
+        text_width = text_bbox[2] - text_bbox[0]
+        text_height = text_bbox[3] - text_bbox[1]
+
+        img_width, img_height = img.size
+        x = LABEL_MARGIN
+        y = img_height - text_height - LABEL_MARGIN
+
+        # Semi-transparent black background for text
+        bg_coords = [(x - 2, y - 2), (x + text_width + 2, y + text_height + 2)]
+        draw.rectangle(bg_coords, fill=(0, 0, 0, 200))
+
+        # Draw text
+        draw.text((x, y), text, fill=(255, 255, 255, 255), font=font)
+
+        return img.tobytes()
+    except Exception:
+        logger.exception("Failed to label image %s", img_path)
+        return None
+
+
+def _generate_with_pil_overlay(images: list, output_path: Path, fps: int) -> bool:
+    """Generate video with filename overlay drawn by Pillow on each frame.
+
+    Labeled frames are piped to ffmpeg as raw RGB, so nothing is re-encoded
+    to JPEG or written to a temporary directory.
+    """
+    try:
+        from PIL import Image
+    except ImportError:
+        logger.error("PIL/Pillow not installed. Cannot add text overlay. Use: pip install Pillow")
+        return _generate_without_overlay(images, output_path, fps)
+
+    try:
+        with Image.open(images[0]) as first:
+            size = first.size
+    except Exception:
+        logger.exception("Failed to read first image %s", images[0])
+        return False
+
+    cmd = [
+        "ffmpeg",
+        "-f", "rawvideo",
+        "-pix_fmt", "rgb24",
+        "-s", f"{size[0]}x{size[1]}",
+        "-framerate", str(fps),
+        "-i", "-",
+        *_encoder_args(),
+        "-pix_fmt", "yuv420p",
+        "-y",
+        str(output_path),
+    ]
+    logger.info("Running: %s", " ".join(cmd))
+
+    # Labeling is CPU bound (decode, draw), so spread it over processes;
+    # threads would serialize on the GIL. Frames are labeled in batches of
+    # at most FRAME_BUFFER_BYTES of raw RGB (and 4 per worker), so large
+    # captures don't pile up in memory ahead of ffmpeg.
+    workers = os.cpu_count() or 1
+    batch_size = max(1, min(workers * 4, FRAME_BUFFER_BYTES // (size[0] * size[1] * 3)))
+    ok = True
+    with tempfile.TemporaryFile() as stderr_file, ProcessPoolExecutor(max_workers=workers) as executor:
+        # Start the workers before ffmpeg: forked workers would otherwise
+        # inherit its stdin pipe and ffmpeg would never see EOF.
+        executor.submit(os.getpid).result()
+        proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=stderr_file)
+        try:
+            for start in range(0, len(images), batch_size):
+                batch = [(p, size) for p in images[start:start + batch_size]]
+                for frame in executor.map(_label_one, batch):
+                    if frame is None:
+                        ok = False
+                        break
+                    proc.stdin.write(frame)
+                if not ok:
+                    break
+                logger.info("Labeled %d / %d images", min(start + batch_size, len(images)), len(images))
+        except BrokenPipeError:
+            logger.error("ffmpeg exited before all frames were written")
+        finally:
+            try:
+                proc.stdin.close()
+            except BrokenPipeError:
+                pass
+            returncode = proc.wait()
+
+        if not ok:
             return False
-        
-        logger.info("Timelapse video created: %s", output_path)
-        return True
+        if returncode != 0:
+            stderr_file.seek(0)
+            logger.error("ffmpeg failed: %s", stderr_file.read().decode("utf-8", "replace"))
+            return False
+
+    logger.info("Timelapse video created: %s", output_path)
+    return True
 
 
 def main() -> int:
@@ -1,15 +1,30 @@
 #!/usr/bin/env python3
 """Simple web server to serve latest image and list downloads."""
 import os
+import sys
 import logging
 from pathlib import Path
-from flask import Flask, send_file, jsonify, redirect, url_for, request, render_template_string
+from flask import Flask, send_file, jsonify, redirect, url_for, request
+from flask.json.provider import DefaultJSONProvider
 import threading
+import atexit
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
 import subprocess
 import uuid
+import time
 from datetime import datetime
 import zipfile
-import io
+import json
+import re
+import mimetypes
+import hashlib
+from zlib import adler32
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 app = Flask(__name__)
 
@@ -19,43 +34,532 @@ STORAGE_ROOT = Path(os.environ.get("STORAGE_ROOT", str(STORAGE_DIR.parent)))
 
 LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")
 
+# Image suffixes listed and zipped by the UI (tuple so str.endswith can take it)
+_IMG_EXTS = (".jpg", ".jpeg", ".png", ".webp")
+
 logging.basicConfig(level=LOG_LEVEL, format="%(asctime)s %(levelname)s %(message)s")
 logger = logging.getLogger("web_server")
 
 
-def _discover_sources():
-    """Return list of (id, dirpath) for discovered sources."""
+class _OrjsonProvider(DefaultJSONProvider):
+    """jsonify() through orjson; types it can't handle go to Flask's default()."""
+
+    def _dumps(self, obj) -> bytes:
+        # honour sort_keys like the default provider (on unless app.json.sort_keys = False)
+        return orjson.dumps(obj, default=self.default, option=orjson.OPT_SORT_KEYS if self.sort_keys else 0)
+
+    def dumps(self, obj, **kwargs):
+        return self._dumps(obj).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self._dumps(obj), mimetype=self.mimetype)
+
+
+# orjson is optional: a C encoder, several times faster on the long name lists
+if orjson is not None:
+    app.json = _OrjsonProvider(app)
+
+# Let a front web server stream files with sendfile(2) instead of Python:
+# X_SENDFILE=1 emits X-Sendfile (Apache mod_xsendfile, lighttpd);
+# X_ACCEL_REDIRECT=/protected/ emits X-Accel-Redirect for an nginx
+# `internal` location aliased to STORAGE_ROOT.
+app.config["USE_X_SENDFILE"] = os.environ.get("X_SENDFILE", "0").lower() in ("1", "true", "yes")
+X_ACCEL_REDIRECT = os.environ.get("X_ACCEL_REDIRECT", "")
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+# download filenames must not contain path separators or start with a dot;
+# names reach the views already percent-decoded, so this also covers %2F
+_BAD_NAME = re.compile(r"[\\/]|\A\.")
+# str.isdigit() would also accept non-ASCII digits such as "٢٠٢٥٠١"
+_MONTH_RE = re.compile(r"[0-9]{6}\Z")
+_TIMESTAMPED_NAME = re.compile(r"\d{8}_\d{6}\.\w+\Z")
+
+
+def _send_path(path: Path, mimetype: str = None, as_attachment: bool = False,
+               conditional: bool = True, max_age: int = None, immutable: bool = False):
+    """send_file() a stored file, delegating to nginx when X_ACCEL_REDIRECT is set.
+
+    Responses carry ETag/Last-Modified so revalidating clients get a 304
+    without a body; ``max_age`` adds a public, must-revalidate Cache-Control,
+    ``immutable`` a year-long one for files that never change. Under gunicorn
+    send_file goes through wsgi.file_wrapper, which uses sendfile(2); byte
+    range responses are routed back onto that path as well.
+    """
+    resp = None
+    if X_ACCEL_REDIRECT:
+        real = Path(os.path.realpath(path))
+        try:
+            rel = real.relative_to(STORAGE_ROOT.resolve())
+        except ValueError:
+            rel = None
+        if rel is not None:
+            resp = app.response_class(mimetype=mimetype or mimetypes.guess_type(real.name)[0] or "application/octet-stream")
+            resp.headers["X-Accel-Redirect"] = X_ACCEL_REDIRECT.rstrip("/") + "/" + rel.as_posix()
+            if as_attachment:
+                resp.headers["Content-Disposition"] = f'attachment; filename="{path.name}"'
+    if resp is None and conditional and request.if_none_match:
+        # Most refreshes of an unchanged image end here: answer the 304 from
+        # one stat instead of letting send_file open the file first. The tag
+        # is built exactly as send_file builds it.
+        st = os.stat(path)
+        etag = f"{st.st_mtime}-{st.st_size}-{adler32(os.fspath(path).encode()) & 0xFFFFFFFF}"
+        if request.if_none_match.contains(etag):
+            resp = app.response_class(status=304)
+            resp.set_etag(etag)
+            resp.last_modified = st.st_mtime
+    if resp is None:
+        resp = send_file(path, mimetype=mimetype, as_attachment=as_attachment,
+                         conditional=conditional, max_age=max_age)
+        if resp.status_code == 206 and "X-Sendfile" not in resp.headers:
+            _range_via_file_wrapper(resp, path)
+    if immutable:
+        max_age = IMMUTABLE_MAX_AGE
+    if max_age is not None:
+        resp.cache_control.no_cache = None
+        resp.cache_control.public = True
+        resp.cache_control.max_age = max_age
+        if immutable:
+            resp.cache_control.immutable = True
+        else:
+            resp.cache_control.must_revalidate = True
+    return resp
+
+
+def _range_via_file_wrapper(resp, path: Path) -> None:
+    """Give a 206 response back to gunicorn's sendfile(2) path.
+
+    Werkzeug serves byte ranges (every <video> request) through a Python
+    wrapper that reads and slices the file in 8 KB chunks. gunicorn sends
+    Content-Length bytes from the file's current offset with sendfile, so a
+    file already seeked to the range start is all it needs. The descriptor
+    send_file opened is duplicated rather than the path reopened, so the
+    bytes sent are those of the file the ETag and Content-Range describe
+    even if it was replaced meanwhile. Other servers don't clip file_wrapper
+    output to Content-Length and keep werkzeug's wrapper.
+    """
+    environ = request.environ
+    file_wrapper = environ.get("wsgi.file_wrapper")
+    if file_wrapper is None or not environ.get("SERVER_SOFTWARE", "").startswith("gunicorn"):
+        return
+    # werkzeug's _RangeWrapper around gunicorn's FileWrapper(filelike)
+    filelike = getattr(getattr(resp.response, "iterable", None), "filelike", None)
+    if filelike is None:
+        return
+    f = os.fdopen(os.dup(filelike.fileno()), "rb")
+    resp.response.close()
+    f.seek(resp.content_range.start)
+    resp.response = file_wrapper(f, 8192)
+    resp.direct_passthrough = True
+
+
+def _download_cache_args(filename: str) -> dict:
+    """Captured frames (YYYYMMDD_HHMMSS.ext) never change once written."""
+    if _TIMESTAMPED_NAME.match(filename):
+        return {"immutable": True}
+    return {"max_age": 30}
+
+
+# ((STORAGE_ROOT, mtime_ns), time.time() of the scan, [(id, dirpath)], {id: dirpath})
+_SOURCES_CACHE = (None, 0.0, [], {})
+
+
+def _source_index():
+    """Return ([(id, dirpath)], {id: dirpath}), rescanning only when STORAGE_ROOT changes."""
+    global _SOURCES_CACHE
+    try:
+        st = os.stat(STORAGE_ROOT)
+    except OSError:
+        st = None
+    cached = _SOURCES_CACHE
+    # as in _list_dir, don't trust a scan taken within a second of the mtime
+    key = (str(STORAGE_ROOT), st.st_mtime_ns) if st is not None else None
+    if key is not None and cached[0] == key and cached[1] - st.st_mtime > 1.0:
+        return cached[2], cached[3]
+
+    scanned_at = time.time()
     sources = []
     try:
-        if STORAGE_ROOT.exists() and any(p.is_dir() for p in STORAGE_ROOT.iterdir()):
-            for child in sorted([p for p in STORAGE_ROOT.iterdir() if p.is_dir()]):
-                images_dir = child / "images"
-                if images_dir.exists() and images_dir.is_dir():
-                    dirpath = images_dir
-                else:
-                    dirpath = child
-                sources.append((child.name, dirpath))
-        else:
-            sources.append((STORAGE_DIR.name or "camera", STORAGE_DIR))
-    except Exception:
+        with os.scandir(STORAGE_ROOT) as it:
+            children = sorted((e.name, e.path) for e in it if e.is_dir())
+        for name, path in children:
+            # If a subdir contains an images/ subfolder, prefer that.
+            images_dir = os.path.join(path, "images")
+            dirpath = Path(images_dir) if os.path.isdir(images_dir) else Path(path)
+            sources.append((name, dirpath))
+    except OSError:
+        sources = []
+    if not sources:
         sources.append((STORAGE_DIR.name or "camera", STORAGE_DIR))
-    return sources
+    by_id = dict(sources)
+    if key is not None:
+        _SOURCES_CACHE = (key, scanned_at, sources, by_id)
+    return sources, by_id
+
+
+def _discover_sources():
+    """Return list of (id, dirpath) for discovered sources (shared, do not modify)."""
+    return _source_index()[0]
 
 
 def _get_source_dir(source_id: str):
     """Map a source id to its directory Path or return None."""
     if not source_id:
         return STORAGE_DIR
-    try:
-        for sid, path in _discover_sources():
-            if sid == source_id:
-                return path
-        # fallback: if source_id equals STORAGE_DIR.name
-        if source_id == (STORAGE_DIR.name or "camera"):
-            return STORAGE_DIR
-    except Exception:
-        return None
-    return None
+    path = _source_index()[1].get(source_id)
+    # fallback: if source_id equals STORAGE_DIR.name
+    if path is None and source_id == (STORAGE_DIR.name or "camera"):
+        return STORAGE_DIR
+    return path
+
+
+# symlink next to the videos that names the newest finished timelapse;
+# maintained by timelapse.py
+LATEST_TIMELAPSE_LINK = "latest_timelapse.mp4"
+
+# str(dirpath) -> (dir mtime_ns, time.time() of the scan, listing)
+_LISTING_CACHE: dict = {}
+_LISTING_LOCK = threading.Lock()
+_EMPTY_LISTING = {"files": [], "images_by_month": {}, "latest_image": None, "monthly_images": {},
+                  "sorted_months": [], "latest_timelapse": None}
+
+
+def _list_dir(dirpath: Path) -> dict:
+    """Scan a storage directory, reusing the previous scan while its mtime is unchanged.
+
+    Returns a dict (shared, do not modify) with ``files`` (all file names but
+    'latest', newest first), ``images_by_month`` (YYYYMM -> unsorted image
+    names), ``latest_image``, ``monthly_images``, ``sorted_months`` and
+    ``latest_timelapse``.
+    Raises OSError if the directory can't be read.
+    """
+    st = os.stat(dirpath)
+    key = str(dirpath)
+    cached = _LISTING_CACHE.get(key)
+    # A scan taken within a second of the mtime may have raced a write that
+    # didn't bump the (coarse) mtime, so only trust older scans.
+    if cached and cached[0] == st.st_mtime_ns and cached[1] - st.st_mtime > 1.0:
+        return cached[2]
+
+    # Concurrent misses (e.g. several viewers right after a capture) queue
+    # here; if the entry was replaced while waiting, reuse that scan.
+    with _LISTING_LOCK:
+        current = _LISTING_CACHE.get(key)
+        if current is not cached:
+            return current[2]
+        scanned_at = time.time()
+        st = os.stat(dirpath)
+        listing = _scan_dir(dirpath)
+        _LISTING_CACHE[key] = (st.st_mtime_ns, scanned_at, listing)
+    return listing
+
+
+def _scan_dir(dirpath: Path) -> dict:
+    """Build the _list_dir() listing with a single scandir pass."""
+    files = []
+    by_month = {}
+    monthly = {}
+    videos = []
+    has_timelapse_link = False
+    # One scandir pass collects both images and timelapse videos; the
+    # dirent type avoids a stat per file. Symlinks ('latest', the timelapse
+    # link while it is being swapped) are skipped without following them.
+    with os.scandir(dirpath) as it:
+        for e in it:
+            name = e.name
+            if name == LATEST_TIMELAPSE_LINK:
+                has_timelapse_link = True
+                continue
+            if name == "latest" or not e.is_file(follow_symlinks=False):
+                continue
+            files.append(name)
+            lower = name.lower()
+            if lower.endswith(_IMG_EXTS):
+                # names are zero-padded timestamps, so the newest image of a
+                # month is the largest name with that YYYYMM prefix
+                month = name[:6]
+                names = by_month.get(month)
+                if names is None:
+                    by_month[month] = [name]
+                    monthly[month] = name
+                else:
+                    names.append(name)
+                    if name > monthly[month]:
+                        monthly[month] = name
+            elif lower.endswith(".mp4"):
+                videos.append(e)
+
+    # The timelapse worker maintains a link to the newest video; only
+    # directories without one need a stat per video to find it.
+    latest_timelapse = None
+    if has_timelapse_link:
+        try:
+            target = os.readlink(os.path.join(dirpath, LATEST_TIMELAPSE_LINK))
+        except OSError:
+            target = None
+        # only trust a link to a video of this scan (not deleted, not elsewhere)
+        if target is not None and any(e.name == target for e in videos):
+            latest_timelapse = target
+    if latest_timelapse is None and videos:
+        # the entries are known regular files: one lstat each, nothing else
+        latest_timelapse = max(videos, key=lambda e: e.stat(follow_symlinks=False).st_mtime).name
+    # names are zero-padded timestamps: lexicographic == chronological
+    files.sort(reverse=True)
+    sorted_months = sorted(monthly, reverse=True)
+
+    return {
+        "files": files,
+        "images_by_month": by_month,
+        "latest_image": monthly[sorted_months[0]] if sorted_months else None,
+        "monthly_images": {month: monthly[month] for month in sorted_months},
+        "sorted_months": sorted_months,
+        "latest_timelapse": latest_timelapse,
+    }
+
+
+INDEX_TEMPLATE_SRC = """
+<!doctype html>
+<html>
+<head>
+    <meta charset="utf-8">
+    <meta name="viewport" content="width=device-width,initial-scale=1">
+    <title>Libakkløkka - Multi Camera</title>
+    <style>
+        body { font-family: Arial, sans-serif; margin: 16px; }
+        .header-controls { margin-bottom: 12px; display:flex; gap:12px; align-items:center; }
+        /* Layout: flexible columns that wrap on small screens */
+        .sources { display:flex; gap:24px; align-items:flex-start; flex-wrap:wrap; }
+        /* Each source column grows to fill available space but has a sensible min-width */
+        .source { border:1px solid #ddd; padding:12px; border-radius:6px; flex:1 1 320px; box-sizing:border-box; max-width:48vw; }
+        .source h2 { margin-top:0 }
+        /* Make the latest image responsive and scale to column width */
+        .source img { width:100%; height:auto; display:block; object-fit:contain; border:1px solid #ccc; }
+        /* Thumbnails remain small but responsive */
+        .month-thumb img { width:120px; max-width:30%; height:auto; border:1px solid #ccc; }
+        /* Video should scale with the column */
+        .source video { width:100%; height:auto; max-width:640px; display:block; }
+        .meta { color:#666; font-size:0.9em }
+    </style>
+</head>
+<body>
+    <h1>Libakkløkka</h1>
+        <div class="header-controls">
+            <button id="tl-all-btn">Create timelapse for all</button>
+            <span id="tl-all-status" class="meta"></span>
+        </div>
+    <div class="sources">
+    {% for s in sources_data %}
+        <div class="source">
+            <h2>Camera: {{ s.id }}</h2>
+            <div>
+                <h3>Latest</h3>
+                {% if s.latest_link %}
+                    <a href="{{ s.latest_link }}"><img src="{{ s.latest_link }}?v={{ s.latest_token }}"{% if s.latest_token %} class="auto-refresh" data-source="{{ s.id }}" data-mtime="{{ s.latest_token }}"{% endif %} alt="latest"></a>
+                {% else %}
+                    <div class="meta">No latest image</div>
+                {% endif %}
+            </div>
+
+            <div>
+                <h3>Images by month</h3>
+                {% for month in s.sorted_months %}
+                    {% set img = s.monthly_images[month] %}
+                    <div class="month-thumb">
+                        <a href="{{ s.download_prefix }}{{ img }}"><img src="{{ s.download_prefix }}{{ img }}" alt="{{ img }}" title="{{ img }}"></a>
+                        <div class="meta"><a href="{{ s.zip_prefix }}{{ month }}">📦 Download all (zip)</a></div>
+                    </div>
+                {% endfor %}
+            </div>
+
+            <div>
+                <h3>Latest timelapse</h3>
+                <div class="timelapse-controls">
+                    <button class="tl-btn" data-source="{{ s.id }}">Create timelapse</button>
+                    <span class="tl-status" id="tl-status-{{ s.id }}">{% if s.latest_timelapse %}Latest: <a href="{{ s.download_prefix }}{{ s.latest_timelapse }}">{{ s.latest_timelapse }}</a>{% else %}No timelapse videos yet.{% endif %}</span>
+                </div>
+                {% if s.latest_timelapse %}
+                    <video controls width="420">
+                        <source src="{{ s.download_prefix }}{{ s.latest_timelapse }}" type="video/mp4">
+                        Your browser does not support the video tag.
+                    </video>
+                    <div class="meta">{{ s.latest_timelapse }}</div>
+                {% endif %}
+            </div>
+        </div>
+    {% endfor %}
+    </div>
+
+    <script>
+        // Live refresh of the latest images (thumbnails never change): the
+        // server pushes new mtimes over /events; if that isn't available,
+        // poll /api/latest-mtime every 30s. An image reloads only when its
+        // mtime changed.
+        function applyMtime(img, mtime) {
+            if (mtime == null || String(mtime) === img.dataset.mtime) return;
+            img.dataset.mtime = mtime;
+            img.src = img.src.split('?')[0] + '?v=' + mtime;
+        }
+        var pollTimer = null;
+        function startPolling() {
+            if (pollTimer) return;
+            pollTimer = setInterval(function(){
+                document.querySelectorAll('img.auto-refresh').forEach(function(img){
+                    fetch('/api/latest-mtime?source=' + encodeURIComponent(img.dataset.source)).then(function(resp){
+                        return resp.ok ? resp.json() : null;
+                    }).then(function(data){
+                        if (data) applyMtime(img, data.mtime);
+                    }).catch(function(){});
+                });
+            }, 30000);
+        }
+        if (document.querySelector('img.auto-refresh')) {
+            if (window.EventSource) {
+                var es = new EventSource('/events');
+                es.onmessage = function(e){
+                    var data = JSON.parse(e.data);
+                    document.querySelectorAll('img.auto-refresh').forEach(function(img){
+                        if (img.dataset.source === data.source) applyMtime(img, data.mtime);
+                    });
+                };
+                es.onerror = function(){
+                    // CLOSED means the server refused the stream (no watcher
+                    // or no free slot); transient drops are retried by the browser
+                    if (es.readyState === EventSource.CLOSED) startPolling();
+                };
+            } else {
+                startPolling();
+            }
+        }
+
+        // Timelapse creation: POST async jobs and poll status
+        async function triggerTimelapseFor(source) {
+            const statusEl = document.getElementById('tl-status-' + source);
+            statusEl.textContent = 'Queued...';
+            try {
+                const resp = await fetch('/timelapse', {
+                    method: 'POST',
+                    headers: {'Content-Type': 'application/x-www-form-urlencoded'},
+                    body: new URLSearchParams({source: source, async: 'true'})
+                });
+                const data = await resp.json();
+                if (!resp.ok) {
+                    statusEl.textContent = 'Error: ' + (data.error || resp.statusText);
+                    return;
+                }
+                const jobId = data.job_id || (data.jobs && data.jobs[0] && data.jobs[0].job_id);
+                if (!jobId) {
+                    // if multiple jobs returned, show list
+                    if (data.jobs) {
+                        statusEl.textContent = 'Queued ' + data.jobs.length + ' jobs';
+                        return;
+                    }
+                    statusEl.textContent = 'No job id returned';
+                    return;
+                }
+
+                statusEl.textContent = 'Job queued: ' + jobId + ' (waiting)';
+
+                // poll status
+                const poll = setInterval(async () => {
+                    try {
+                        const r2 = await fetch('/timelapse/' + jobId);
+                        const j = await r2.json();
+                        if (j.status === 'finished') {
+                            clearInterval(poll);
+                            const out = j.output_path || j.output;
+                            if (out) {
+                                // build a download URL relative to this source
+                                const url = '/source/' + source + '/download/' + out.split('/').pop();
+                                statusEl.innerHTML = 'Done: <a href="' + url + '">Download</a>';
+                            } else {
+                                statusEl.textContent = 'Finished — check server';
+                            }
+                        } else if (j.status === 'failed' || j.status === 'error') {
+                            clearInterval(poll);
+                            statusEl.textContent = 'Failed: ' + (j.stderr || j.error || j.exit_code || 'error');
+                        }
+                    } catch (err) {
+                        clearInterval(poll);
+                        statusEl.textContent = 'Polling error';
+                    }
+                }, 2000);
+
+            } catch (err) {
+                statusEl.textContent = 'Request failed';
+            }
+        }
+
+        document.addEventListener('click', function(ev){
+            if (ev.target && ev.target.classList && ev.target.classList.contains('tl-btn')) {
+                const src = ev.target.getAttribute('data-source');
+                triggerTimelapseFor(src);
+            }
+        });
+
+        document.getElementById('tl-all-btn').addEventListener('click', async function(){
+            const statusEl = document.getElementById('tl-all-status');
+            statusEl.textContent = 'Queuing...';
+            try {
+                const resp = await fetch('/timelapse', {
+                    method: 'POST',
+                    headers: {'Content-Type': 'application/x-www-form-urlencoded'},
+                    body: new URLSearchParams({source: 'all', async: 'true'})
+                });
+                const data = await resp.json();
+                if (!resp.ok) {
+                    statusEl.textContent = 'Error: ' + (data.error || resp.statusText);
+                    return;
+                }
+                if (!data.jobs || !data.jobs.length) {
+                    statusEl.textContent = 'No jobs created';
+                    return;
+                }
+
+                // show queued jobs
+                statusEl.innerHTML = 'Queued: ' + data.jobs.map(j => j.source).join(', ');
+
+                // For each job, poll until finished and then append a link
+                data.jobs.forEach(j => {
+                    const jid = j.job_id;
+                    const src = j.source;
+                    const p = document.createElement('div');
+                    p.textContent = src + ': waiting...';
+                    statusEl.appendChild(p);
+
+                    const poll = setInterval(async () => {
+                        try {
+                            const r = await fetch('/timelapse/' + jid);
+                            const obj = await r.json();
+                            if (obj.status === 'finished') {
+                                clearInterval(poll);
+                                const out = obj.output_path || obj.output || j.output_path;
+                                const fname = out.split('/').pop();
+                                p.innerHTML = src + ': <a href="/source/' + src + '/download/' + fname + '">Download</a>';
+                            } else if (obj.status === 'failed' || obj.status === 'error') {
+                                clearInterval(poll);
+                                p.textContent = src + ': failed';
+                            }
+                        } catch (er) {
+                            clearInterval(poll);
+                            p.textContent = src + ': polling error';
+                        }
+                    }, 2000);
+                });
+
+            } catch (err) {
+                statusEl.textContent = 'Request failed';
+            }
+        });
+    </script>
+</body>
+</html>
+"""
+# compiled once at import instead of on every request; Flask's environment
+# autoescapes templates without a file name, so ids and names are escaped
+INDEX_TEMPLATE = app.jinja_env.from_string(INDEX_TEMPLATE_SRC)
 
 
 @app.route("/")
@@ -63,308 +567,300 @@ def index():
         """Render a multi-source UI: each discovered camera shows latest image, monthly thumbnails and latest timelapse."""
 
         # Discover sources under STORAGE_ROOT. If there are no subdirs, fall back to single STORAGE_DIR.
-        sources = []
-        try:
-            if STORAGE_ROOT.exists() and any(p.is_dir() for p in STORAGE_ROOT.iterdir()):
-                for child in sorted([p for p in STORAGE_ROOT.iterdir() if p.is_dir()]):
-                    # If a subdir contains an images/ subfolder, prefer that.
-                    images_dir = child / "images"
-                    if images_dir.exists() and images_dir.is_dir():
-                        dirpath = images_dir
-                    else:
-                        dirpath = child
-                    sources.append({"id": child.name, "dir": dirpath})
-            else:
-                sources.append({"id": STORAGE_DIR.name or "camera", "dir": STORAGE_DIR})
-        except Exception:
-            sources = [{"id": STORAGE_DIR.name or "camera", "dir": STORAGE_DIR}]
+        sources = [{"id": sid, "dir": dirpath} for sid, dirpath in _discover_sources()]
 
         sources_data = []
         for src in sources:
             dirpath = src["dir"]
-            imgs = []
             try:
-                imgs = sorted([
-                    p.name for p in dirpath.iterdir()
-                    if p.is_file() and p.suffix.lower() in (".jpg", ".jpeg", ".png", ".webp") and p.name != "latest"
-                ], reverse=True)
-            except Exception:
-                imgs = []
+                listing = _list_dir(dirpath)
+            except OSError:
+                listing = _EMPTY_LISTING
+            monthly_images = listing["monthly_images"]
+            sorted_months = listing["sorted_months"]
+            latest_timelapse = listing["latest_timelapse"]
 
-            monthly_images = {}
-            for img in imgs:
-                month_key = img[:6]
-                if month_key not in monthly_images:
-                    monthly_images[month_key] = img
-
-            sorted_months = sorted(monthly_images.keys(), reverse=True)
+            # one url_for per source; the template appends names to these
+            download_prefix = url_for("download_source", source=src["id"], filename="_")[:-1]
+            zip_prefix = url_for("download_zip_source", source=src["id"], month="_")[:-1]
 
             latest_img = None
             latest_link = None
+            # cache key for the <img> URL: only changes when the image does,
+            # so browsers can keep and revalidate it instead of refetching
+            latest_token = ""
             try:
-                # prefer a 'latest' symlink if present
-                latest_link_path = dirpath / "latest"
-                if latest_link_path.exists() or latest_link_path.is_symlink():
-                    latest_img = latest_link_path.name
+                # prefer a 'latest' symlink if present; one stat both checks
+                # it resolves and provides the token
+                try:
+                    latest_st = os.stat(dirpath / "latest")
+                except FileNotFoundError:
+                    latest_st = None
+                if latest_st is not None:
+                    latest_img = "latest"
                     latest_link = url_for("latest_source", source=src["id"])
-                elif imgs:
-                    latest_img = imgs[0]
-                    latest_link = url_for("download_source", source=src["id"], filename=latest_img)
+                    latest_token = int(latest_st.st_mtime)
+                elif listing["latest_image"]:
+                    latest_img = listing["latest_image"]
+                    latest_link = download_prefix + latest_img
             except Exception:
                 latest_img = None
                 latest_link = None
 
-            # find latest timelapse in this dir
-            latest_timelapse = None
-            try:
-                timelapses = [ (p.stat().st_mtime, p.name) for p in dirpath.iterdir() if p.is_file() and p.suffix.lower() == ".mp4" ]
-                timelapses.sort(reverse=True)
-                if timelapses:
-                    latest_timelapse = timelapses[0][1]
-            except Exception:
-                latest_timelapse = None
-
             sources_data.append({
                 "id": src["id"],
                 "dir": str(dirpath),
+                "download_prefix": download_prefix,
+                "zip_prefix": zip_prefix,
                 "monthly_images": monthly_images,
                 "sorted_months": sorted_months,
                 "latest_link": latest_link,
                 "latest_img": latest_img,
+                "latest_token": latest_token,
                 "latest_timelapse": latest_timelapse,
             })
 
-        html = """
-        <!doctype html>
-        <html>
-        <head>
-            <meta charset="utf-8">
-            <meta name="viewport" content="width=device-width,initial-scale=1">
-            <title>Libakkløkka - Multi Camera</title>
-            <style>
-                body { font-family: Arial, sans-serif; margin: 16px; }
-                .header-controls { margin-bottom: 12px; display:flex; gap:12px; align-items:center; }
-                /* Layout: flexible columns that wrap on small screens */
-                .sources { display:flex; gap:24px; align-items:flex-start; flex-wrap:wrap; }
-                /* Each source column grows to fill available space but has a sensible min-width */
-                .source { border:1px solid #ddd; padding:12px; border-radius:6px; flex:1 1 320px; box-sizing:border-box; max-width:48vw; }
-                .source h2 { margin-top:0 }
-                /* Make the latest image responsive and scale to column width */
-                .source img { width:100%; height:auto; display:block; object-fit:contain; border:1px solid #ccc; }
-                /* Thumbnails remain small but responsive */
-                .month-thumb img { width:120px; max-width:30%; height:auto; border:1px solid #ccc; }
-                /* Video should scale with the column */
-                .source video { width:100%; height:auto; max-width:640px; display:block; }
-                .meta { color:#666; font-size:0.9em }
-            </style>
-        </head>
-        <body>
-            <h1>Libakkløkka</h1>
-                <div class="header-controls">
-                    <button id="tl-all-btn">Create timelapse for all</button>
-                    <span id="tl-all-status" class="meta"></span>
-                </div>
-            <div class="sources">
-            {% for s in sources_data %}
-                <div class="source">
-                    <h2>Camera: {{ s.id }}</h2>
-                    <div>
-                        <h3>Latest</h3>
-                        {% if s.latest_link %}
-                            <a href="{{ s.latest_link }}"><img src="{{ s.latest_link }}?t={{ now_ts }}" alt="latest"></a>
-                        {% else %}
-                            <div class="meta">No latest image</div>
-                        {% endif %}
-                    </div>
-
-                    <div>
-                        <h3>Images by month</h3>
-                        {% for month in s.sorted_months %}
-                            {% set img = s.monthly_images[month] %}
-                            <div class="month-thumb">
-                                <a href="/source/{{ s.id }}/download/{{ img }}"><img src="/source/{{ s.id }}/download/{{ img }}" alt="{{ img }}" title="{{ img }}"></a>
-                                <div class="meta"><a href="/source/{{ s.id }}/download/zip/{{ month }}">📦 Download all (zip)</a></div>
-                            </div>
-                        {% endfor %}
-                    </div>
 
-                    <div>
-                        <h3>Latest timelapse</h3>
-                        <div class="timelapse-controls">
-                            <button class="tl-btn" data-source="{{ s.id }}">Create timelapse</button>
-                            <span class="tl-status" id="tl-status-{{ s.id }}">{% if s.latest_timelapse %}Latest: <a href="/source/{{ s.id }}/download/{{ s.latest_timelapse }}">{{ s.latest_timelapse }}</a>{% else %}No timelapse videos yet.{% endif %}</span>
-                        </div>
-                        {% if s.latest_timelapse %}
-                            <video controls width="420">
-                                <source src="/source/{{ s.id }}/download/{{ s.latest_timelapse }}" type="video/mp4">
-                                Your browser does not support the video tag.
-                            </video>
-                            <div class="meta">{{ s.latest_timelapse }}</div>
-                        {% endif %}
-                    </div>
-                </div>
-            {% endfor %}
-            </div>
+        return INDEX_TEMPLATE.render(sources_data=sources_data)
 
-            <script>
-                // auto-refresh every 30s
-                setInterval(function(){
-                    var imgs = document.querySelectorAll('img');
-                    imgs.forEach(function(img){
-                        var src = img.src.split('?')[0];
-                        img.src = src + '?t=' + Date.now();
-                    });
-                }, 30000);
 
-                // Timelapse creation: POST async jobs and poll status
-                async function triggerTimelapseFor(source) {
-                    const statusEl = document.getElementById('tl-status-' + source);
-                    statusEl.textContent = 'Queued...';
-                    try {
-                        const resp = await fetch('/timelapse', {
-                            method: 'POST',
-                            headers: {'Content-Type': 'application/x-www-form-urlencoded'},
-                            body: new URLSearchParams({source: source, async: 'true'})
-                        });
-                        const data = await resp.json();
-                        if (!resp.ok) {
-                            statusEl.textContent = 'Error: ' + (data.error || resp.statusText);
-                            return;
-                        }
-                        const jobId = data.job_id || (data.jobs && data.jobs[0] && data.jobs[0].job_id);
-                        if (!jobId) {
-                            // if multiple jobs returned, show list
-                            if (data.jobs) {
-                                statusEl.textContent = 'Queued ' + data.jobs.length + ' jobs';
-                                return;
-                            }
-                            statusEl.textContent = 'No job id returned';
-                            return;
-                        }
-
-                        statusEl.textContent = 'Job queued: ' + jobId + ' (waiting)';
-
-                        // poll status
-                        const poll = setInterval(async () => {
-                            try {
-                                const r2 = await fetch('/timelapse/' + jobId);
-                                const j = await r2.json();
-                                if (j.status === 'finished') {
-                                    clearInterval(poll);
-                                    const out = j.output_path || j.output;
-                                    if (out) {
-                                        // build a download URL relative to this source
-                                        const url = '/source/' + source + '/download/' + out.split('/').pop();
-                                        statusEl.innerHTML = 'Done: <a href="' + url + '">Download</a>';
-                                    } else {
-                                        statusEl.textContent = 'Finished — check server';
-                                    }
-                                } else if (j.status === 'failed' || j.status === 'error') {
-                                    clearInterval(poll);
-                                    statusEl.textContent = 'Failed: ' + (j.stderr || j.error || j.exit_code || 'error');
-                                }
-                            } catch (err) {
-                                clearInterval(poll);
-                                statusEl.textContent = 'Polling error';
-                            }
-                        }, 2000);
-
-                    } catch (err) {
-                        statusEl.textContent = 'Request failed';
-                    }
-                }
+def _resolve_latest():
+    """Return the real path STORAGE_DIR/latest points to, or None."""
+    latest_link = STORAGE_DIR / "latest"
+    if not os.path.lexists(latest_link):
+        return None
+    return Path(os.path.realpath(latest_link))
 
-                document.addEventListener('click', function(ev){
-                    if (ev.target && ev.target.classList && ev.target.classList.contains('tl-btn')) {
-                        const src = ev.target.getAttribute('data-source');
-                        triggerTimelapseFor(src);
-                    }
-                });
 
-                document.getElementById('tl-all-btn').addEventListener('click', async function(){
-                    const statusEl = document.getElementById('tl-all-status');
-                    statusEl.textContent = 'Queuing...';
-                    try {
-                        const resp = await fetch('/timelapse', {
-                            method: 'POST',
-                            headers: {'Content-Type': 'application/x-www-form-urlencoded'},
-                            body: new URLSearchParams({source: 'all', async: 'true'})
-                        });
-                        const data = await resp.json();
-                        if (!resp.ok) {
-                            statusEl.textContent = 'Error: ' + (data.error || resp.statusText);
-                            return;
-                        }
-                        if (!data.jobs || !data.jobs.length) {
-                            statusEl.textContent = 'No jobs created';
-                            return;
-                        }
+# Resolved target of STORAGE_DIR/latest, kept current by an inotify watch
+# (watchdog) so /latest needs no stat calls. None if the watch isn't running.
+_LATEST_PATH = None
+_LATEST_WATCHED = False
 
-                        // show queued jobs
-                        statusEl.innerHTML = 'Queued: ' + data.jobs.map(j => j.source).join(', ');
-
-                        // For each job, poll until finished and then append a link
-                        data.jobs.forEach(j => {
-                            const jid = j.job_id;
-                            const src = j.source;
-                            const p = document.createElement('div');
-                            p.textContent = src + ': waiting...';
-                            statusEl.appendChild(p);
-
-                            const poll = setInterval(async () => {
-                                try {
-                                    const r = await fetch('/timelapse/' + jid);
-                                    const obj = await r.json();
-                                    if (obj.status === 'finished') {
-                                        clearInterval(poll);
-                                        const out = obj.output_path || obj.output || j.output_path;
-                                        const fname = out.split('/').pop();
-                                        p.innerHTML = src + ': <a href="/source/' + src + '/download/' + fname + '">Download</a>';
-                                    } else if (obj.status === 'failed' || obj.status === 'error') {
-                                        clearInterval(poll);
-                                        p.textContent = src + ': failed';
-                                    }
-                                } catch (er) {
-                                    clearInterval(poll);
-                                    p.textContent = src + ': polling error';
-                                }
-                            }, 2000);
-                        });
 
-                    } catch (err) {
-                        statusEl.textContent = 'Request failed';
-                    }
-                });
-            </script>
-        </body>
-        </html>
-        """
+def _start_latest_watcher() -> bool:
+    """Watch STORAGE_DIR for changes to 'latest'; False if that's not possible."""
+    global _LATEST_PATH
+    try:
+        from watchdog.events import FileSystemEventHandler
+        from watchdog.observers import Observer
+    except ImportError:
+        logger.info("watchdog not installed; /latest resolves the symlink per request")
+        return False
+
+    class _LatestHandler(FileSystemEventHandler):
+        def on_any_event(self, event):
+            global _LATEST_PATH
+            # the link target only changes when 'latest' is (re)created,
+            # removed or renamed over; opens and reads by /latest don't count
+            if event.event_type not in ("created", "deleted", "moved"):
+                return
+            paths = (getattr(event, "src_path", ""), getattr(event, "dest_path", ""))
+            if any(os.path.basename(p) == "latest" for p in paths if p):
+                _LATEST_PATH = _resolve_latest()
 
-        return render_template_string(html, sources_data=sources_data, now_ts=int(datetime.utcnow().timestamp()))
+    try:
+        observer = Observer()
+        observer.schedule(_LatestHandler(), str(STORAGE_DIR), recursive=False)
+        observer.daemon = True
+        observer.start()
+    except Exception:
+        logger.exception("Failed to watch %s; /latest resolves the symlink per request", STORAGE_DIR)
+        return False
+    _LATEST_PATH = _resolve_latest()
+    return True
 
 
 @app.route("/latest")
 def latest():
     """Serve the latest image."""
-    latest_link = STORAGE_DIR / "latest"
-    if latest_link.exists() or latest_link.is_symlink():
-        try:
-            return send_file(latest_link, mimetype="image/jpeg")
-        except Exception as e:
-            logger.exception("Failed to serve latest image")
-            return jsonify({"error": str(e)}), 500
-    return jsonify({"error": "No latest image available"}), 404
+    path = _LATEST_PATH if _LATEST_WATCHED else _resolve_latest()
+    if path is None:
+        return jsonify({"error": "No latest image available"}), 404
+    try:
+        return _send_path(path, mimetype="image/jpeg", conditional=True, max_age=5)
+    except FileNotFoundError:
+        # target removed (e.g. by retention) before the watcher caught up
+        return jsonify({"error": "No latest image available"}), 404
+    except Exception as e:
+        logger.exception("Failed to serve latest image")
+        return jsonify({"error": str(e)}), 500
+
+
+_LATEST_WATCHED = STORAGE_DIR.is_dir() and _start_latest_watcher()
+
+
+# Seconds to wait after a capture before re-scanning: _list_dir doesn't trust
+# a scan taken within a second of the directory mtime.
+LISTING_WARM_DELAY = 1.5
+_WARM_PENDING: set = set()
+_WARM_LOCK = threading.Lock()
+
+
+def _warm_listing(dirpath: Path) -> None:
+    """Rebuild the cached listing of ``dirpath`` off the request path."""
+    with _WARM_LOCK:
+        _WARM_PENDING.discard(str(dirpath))
+    try:
+        _list_dir(dirpath)
+    except OSError:
+        pass
+
+
+def _schedule_warm_listing(dirpath: Path) -> None:
+    # one capture touches the directory several times (temp file, rename,
+    # 'latest' swap); they all collapse into a single delayed scan
+    key = str(dirpath)
+    with _WARM_LOCK:
+        if key in _WARM_PENDING:
+            return
+        _WARM_PENDING.add(key)
+    timer = threading.Timer(LISTING_WARM_DELAY, _warm_listing, (dirpath,))
+    timer.daemon = True
+    timer.start()
+
+
+def _start_listing_warmer() -> bool:
+    """Re-scan source directories right after captures land; False if not possible.
+
+    The index, /list and the zips then find a fresh listing instead of the
+    first viewer after each capture paying for the scan. Changes to a
+    source's 'latest' link are also pushed to /events subscribers.
+
+    STORAGE_ROOT is watched recursively, so cameras whose directories the
+    fetcher creates after startup are covered without a restart.
+    """
+    try:
+        from watchdog.events import FileSystemEventHandler
+        from watchdog.observers import Observer
+    except ImportError:
+        return False
+
+    class _WarmHandler(FileSystemEventHandler):
+        def on_any_event(self, event):
+            # only entries appearing/disappearing change the listing; opens
+            # and reads (downloads, zips) must not trigger scans
+            if event.event_type not in ("created", "deleted", "moved") or event.is_directory:
+                return
+            # the current sources, so directories added since startup count
+            by_dir = {str(dirpath): source_id for source_id, dirpath in _discover_sources()}
+            for path in (event.src_path, getattr(event, "dest_path", "")):
+                source_id = by_dir.get(os.path.dirname(path)) if path else None
+                if source_id is None:
+                    continue
+                dirpath = Path(os.path.dirname(path))
+                _schedule_warm_listing(dirpath)
+                if os.path.basename(path) == "latest":
+                    _notify_latest(source_id, dirpath)
+
+    try:
+        observer = Observer()
+        handler = _WarmHandler()
+        observer.schedule(handler, str(STORAGE_ROOT), recursive=True)
+        # the single-directory fallback may live outside STORAGE_ROOT
+        if STORAGE_DIR.is_dir() and STORAGE_ROOT not in STORAGE_DIR.parents:
+            observer.schedule(handler, str(STORAGE_DIR), recursive=False)
+        observer.daemon = True
+        observer.start()
+    except Exception:
+        logger.exception("Failed to watch source directories; listings are rebuilt on request")
+        return False
+    return True
+
+
+# source id -> mtime (whole seconds) of its latest image as last seen by the
+# watcher; /events streams wait on the condition for changes
+_LATEST_MTIMES: dict = {}
+_LATEST_CHANGED = threading.Condition()
+
+
+def _notify_latest(source_id: str, dirpath: Path) -> None:
+    try:
+        mtime = int(os.stat(dirpath / "latest").st_mtime)
+    except OSError:
+        return
+    with _LATEST_CHANGED:
+        if _LATEST_MTIMES.get(source_id) != mtime:
+            _LATEST_MTIMES[source_id] = mtime
+            _LATEST_CHANGED.notify_all()
+
+
+_LISTING_WARMER = STORAGE_ROOT.is_dir() and _start_listing_warmer()
+
+# Every open /events stream holds a server thread (gthread worker), so keep
+# them well under WEB_THREADS; pages that don't get a slot poll instead.
+SSE_MAX_CLIENTS = int(os.environ.get("SSE_MAX_CLIENTS", "4"))
+# streams end after this long and the browser reconnects, so a slot held by
+# a vanished client is freed even if no write ever fails
+SSE_MAX_SECONDS = 300
+SSE_KEEPALIVE_SECONDS = 25
+_SSE_SLOTS = threading.BoundedSemaphore(SSE_MAX_CLIENTS) if SSE_MAX_CLIENTS > 0 else None
+
+
+@app.route("/events")
+def events():
+    """Server-sent events: one ``{"source", "mtime"}`` message per new latest image."""
+    slots = _SSE_SLOTS
+    if not _LISTING_WARMER or slots is None:
+        return jsonify({"error": "Live updates not available"}), 404
+    if not slots.acquire(blocking=False):
+        return jsonify({"error": "Too many live clients"}), 503
+
+    def generate():
+        with _LATEST_CHANGED:
+            seen = dict(_LATEST_MTIMES)
+        yield b"retry: 5000\n\n"
+        deadline = time.monotonic() + SSE_MAX_SECONDS
+        while time.monotonic() < deadline:
+            with _LATEST_CHANGED:
+                _LATEST_CHANGED.wait(SSE_KEEPALIVE_SECONDS)
+                current = dict(_LATEST_MTIMES)
+            changed = [(sid, m) for sid, m in current.items() if seen.get(sid) != m]
+            seen = current
+            if not changed:
+                yield b": keepalive\n\n"
+            for sid, mtime in changed:
+                yield f"data: {json.dumps({'source': sid, 'mtime': mtime})}\n\n".encode()
+
+    resp = app.response_class(
+        generate(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+    # released when the server closes the response, which also happens for
+    # bodies never iterated (HEAD), unlike a finally in the generator; no
+    # direct_passthrough, which would hand out the bare generator and skip this
+    resp.call_on_close(slots.release)
+    return resp
+
+
+# str(dirpath) -> (listing it was built from, encoded JSON body, ETag);
+# _list_dir returns the same listing object until the directory changes, so
+# the body is serialized, encoded and hashed once per change, not per request.
+_LIST_PAYLOADS: dict = {}
+
+
+def _list_response(dirpath: Path):
+    """The {"images": [...], "count": n} listing of ``dirpath`` as a JSON response."""
+    listing = _list_dir(dirpath)
+    key = str(dirpath)
+    cached = _LIST_PAYLOADS.get(key)
+    if cached is None or cached[0] is not listing:
+        files = listing["files"]
+        body = app.json.dumps({"images": files, "count": len(files)}).encode()
+        cached = (listing, body, hashlib.blake2b(body, digest_size=16).hexdigest())
+        _LIST_PAYLOADS[key] = cached
+    resp = app.response_class(cached[1], mimetype="application/json")
+    resp.set_etag(cached[2])
+    resp.cache_control.max_age = 5
+    return resp.make_conditional(request)
 
 
 @app.route("/list")
 def list_images():
     """List all images in JSON format."""
     try:
-        files = sorted([
-            p.name for p in STORAGE_DIR.iterdir()
-            if p.is_file() and p.name != "latest"
-        ], reverse=True)
-        return jsonify({"images": files, "count": len(files)})
+        return _list_response(STORAGE_DIR)
     except Exception as e:
         logger.exception("Failed to list images")
         return jsonify({"error": str(e)}), 500
@@ -374,15 +870,14 @@ def list_images():
 def download(filename):
     """Download a specific image."""
     # sanitize filename to prevent path traversal
-    if "/" in filename or "\\" in filename or filename.startswith("."):
+    if _BAD_NAME.search(filename):
         return jsonify({"error": "Invalid filename"}), 400
     
     file_path = STORAGE_DIR / filename
-    if not file_path.exists():
-        return jsonify({"error": "File not found"}), 404
-    
     try:
-        return send_file(file_path, as_attachment=True)
+        return _send_path(file_path, as_attachment=True, conditional=True, **_download_cache_args(filename))
+    except FileNotFoundError:
+        return jsonify({"error": "File not found"}), 404
     except Exception as e:
         logger.exception("Failed to download %s", filename)
         return jsonify({"error": str(e)}), 500
@@ -395,32 +890,58 @@ def latest_source(source):
     if not dirpath:
         return jsonify({"error": "Source not found"}), 404
 
-    latest_link = dirpath / "latest"
-    if latest_link.exists() or latest_link.is_symlink():
-        try:
-            return send_file(latest_link)
-        except Exception as e:
-            logger.exception("Failed to serve latest image for %s", source)
-            return jsonify({"error": str(e)}), 500
+    # send_file stats the target anyway, so just try the 'latest' link and
+    # treat a missing (or dangling) link as the fallback case
+    try:
+        return _send_path(dirpath / "latest", conditional=True, max_age=5)
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logger.exception("Failed to serve latest image for %s", source)
+        return jsonify({"error": str(e)}), 500
 
     # fallback: serve newest image file
     try:
-        files = sorted([p for p in dirpath.iterdir() if p.is_file() and p.name != 'latest'], reverse=True)
-        if files:
-            return send_file(files[0])
+        newest = _list_dir(dirpath)["latest_image"]
+        if newest:
+            return _send_path(dirpath / newest, conditional=True, max_age=5)
     except Exception:
         pass
     return jsonify({"error": "No latest image available"}), 404
 
 
+# source id -> (time.monotonic() expiry, mtime); the page polls every 30s
+# per open tab, so a 1s TTL keeps many viewers to about one stat a second
+_LATEST_MTIME_CACHE: dict = {}
+LATEST_MTIME_TTL = 1.0
+
+
+@app.route("/api/latest-mtime")
+def latest_mtime():
+    """Mtime (whole seconds) of a source's latest image, or null if it has none."""
+    source = request.args.get("source", "")
+    now = time.monotonic()
+    cached = _LATEST_MTIME_CACHE.get(source)
+    if cached and cached[0] > now:
+        return jsonify({"mtime": cached[1]})
+    dirpath = _get_source_dir(source)
+    if not dirpath:
+        return jsonify({"error": "Source not found"}), 404
+    try:
+        mtime = int(os.stat(dirpath / "latest").st_mtime)
+    except OSError:
+        mtime = None
+    _LATEST_MTIME_CACHE[source] = (now + LATEST_MTIME_TTL, mtime)
+    return jsonify({"mtime": mtime})
+
+
 @app.route("/source/<source>/list")
 def list_images_source(source):
     dirpath = _get_source_dir(source)
     if not dirpath:
         return jsonify({"error": "Source not found"}), 404
     try:
-        files = sorted([p.name for p in dirpath.iterdir() if p.is_file() and p.name != 'latest'], reverse=True)
-        return jsonify({"images": files, "count": len(files)})
+        return _list_response(dirpath)
     except Exception as e:
         logger.exception("Failed to list images for %s", source)
         return jsonify({"error": str(e)}), 500
@@ -429,16 +950,16 @@ def list_images_source(source):
 @app.route("/source/<source>/download/<filename>")
 def download_source(source, filename):
     # sanitize filename to prevent path traversal
-    if "/" in filename or "\\" in filename or filename.startswith('.'):
+    if _BAD_NAME.search(filename):
         return jsonify({"error": "Invalid filename"}), 400
     dirpath = _get_source_dir(source)
     if not dirpath:
         return jsonify({"error": "Source not found"}), 404
     file_path = dirpath / filename
-    if not file_path.exists():
-        return jsonify({"error": "File not found"}), 404
     try:
-        return send_file(file_path, as_attachment=True)
+        return _send_path(file_path, as_attachment=True, conditional=True, **_download_cache_args(filename))
+    except FileNotFoundError:
+        return jsonify({"error": "File not found"}), 404
     except Exception as e:
         logger.exception("Failed to download %s from %s", filename, source)
         return jsonify({"error": str(e)}), 500
@@ -447,15 +968,187 @@ def download_source(source, filename):
 @app.route("/health")
 def health():
     """Health check endpoint."""
-    return jsonify({"status": "ok"})
+    return jsonify({"status": "ok", "queue_depth": _queue_depth()})
+
+
+# In-memory job registry for async timelapse generation. Written from worker
+# threads and read from request threads, so every access goes through the
+# lock; the oldest entries are evicted once _JOBS_MAX is exceeded.
+_JOBS_LOCK = threading.Lock()
+_JOBS: "OrderedDict[str, dict]" = OrderedDict()
+_JOBS_MAX = 1000
+
+# Optional JSON file the registry is mirrored to, so job status survives a
+# web server restart. Empty disables it. Writes happen on a timer thread,
+# JOBS_SAVE_DELAY seconds after the first change, never on a request thread.
+JOBS_FILE = os.environ.get("JOBS_FILE", "")
+JOBS_SAVE_DELAY = 1.0
+_JOBS_FILE_LOCK = threading.Lock()
+_JOBS_SAVE_PENDING = False
+
+
+def _jobs_set(job_id: str, **fields) -> None:
+    with _JOBS_LOCK:
+        job = _JOBS.setdefault(job_id, {})
+        _JOBS.move_to_end(job_id)
+        job.update(fields)
+        _evict_jobs()
+    if JOBS_FILE:
+        _schedule_save_jobs()
+
+
+def _schedule_save_jobs() -> None:
+    # a job's queued/running/finished updates collapse into a single write
+    global _JOBS_SAVE_PENDING
+    with _JOBS_LOCK:
+        if _JOBS_SAVE_PENDING:
+            return
+        _JOBS_SAVE_PENDING = True
+    if _TL_STOPPING.is_set():
+        # no new threads while exiting; the atexit flush writes it
+        return
+    timer = threading.Timer(JOBS_SAVE_DELAY, _save_jobs)
+    timer.daemon = True
+    timer.start()
+
+
+def _evict_jobs() -> None:
+    """Trim _JOBS to _JOBS_MAX (lock held), dropping the oldest finished jobs first.
+
+    Queued and running jobs are only evicted when nothing else is left, so a
+    burst of requests can't push out the status of work still in progress.
+    """
+    excess = len(_JOBS) - _JOBS_MAX
+    if excess <= 0:
+        return
+    done = [jid for jid, job in _JOBS.items() if job.get("status") not in ("queued", "running")][:excess]
+    for jid in done:
+        del _JOBS[jid]
+    while len(_JOBS) > _JOBS_MAX:
+        _JOBS.popitem(last=False)
+
+
+def _save_jobs() -> None:
+    """Atomically write the registry to JOBS_FILE."""
+    global _JOBS_SAVE_PENDING
+    if not JOBS_FILE:
+        return
+    # the file lock keeps snapshots landing in the order they were taken
+    with _JOBS_FILE_LOCK:
+        with _JOBS_LOCK:
+            # changes after this snapshot schedule a new write
+            _JOBS_SAVE_PENDING = False
+            payload = json.dumps(_JOBS)
+        tmp = JOBS_FILE + ".tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(payload)
+            os.replace(tmp, JOBS_FILE)
+        except OSError:
+            logger.exception("Failed to save jobs to %s", JOBS_FILE)
+
+
+def _flush_jobs() -> None:
+    """Write changes still waiting for their timer (at exit)."""
+    if _JOBS_SAVE_PENDING:
+        _save_jobs()
+
+
+def _load_jobs() -> None:
+    """Restore the registry from JOBS_FILE; unfinished jobs died with the old process."""
+    if not JOBS_FILE:
+        return
+    try:
+        with open(JOBS_FILE, encoding="utf-8") as f:
+            saved = json.load(f)
+    except FileNotFoundError:
+        return
+    except (OSError, ValueError):
+        logger.exception("Ignoring unreadable jobs file %s", JOBS_FILE)
+        return
+    if not isinstance(saved, dict):
+        logger.error("Ignoring jobs file %s: expected a JSON object", JOBS_FILE)
+        return
+    with _JOBS_LOCK:
+        for job_id, job in saved.items():
+            if not isinstance(job, dict):
+                continue
+            if job.get("status") in ("queued", "running"):
+                job["status"] = "interrupted"
+            _JOBS[job_id] = job
+        _evict_jobs()
+
+
+def _queue_depth() -> int:
+    with _JOBS_LOCK:
+        return sum(1 for job in _JOBS.values() if job.get("status") == "queued")
+
+
+def _jobs_get(job_id: str):
+    with _JOBS_LOCK:
+        job = _JOBS.get(job_id)
+        return dict(job) if job is not None else None
+
+
+_load_jobs()
+atexit.register(_flush_jobs)
+
+
+# Async timelapse jobs run here; with the default of one worker only a single
+# ffmpeg encode runs at a time and further requests wait as "queued".
+TIMELAPSE_CONCURRENCY = max(1, int(os.environ.get("TIMELAPSE_CONCURRENCY", "1")))
+_TL_EXEC = ThreadPoolExecutor(max_workers=TIMELAPSE_CONCURRENCY, thread_name_prefix="tl")
+# running timelapse child processes, terminated when the web server exits
+_TL_PROCS: set = set()
+_TL_STOPPING = threading.Event()
+
+
+def _stop_timelapse_jobs() -> None:
+    """Drop queued jobs and terminate running ones so exiting doesn't wait for encodes.
+
+    concurrent.futures joins its worker threads at exit (after draining the
+    queue), before any atexit handler runs, so this is registered as a
+    threading exit hook, which runs ahead of that join. Dropped and
+    terminated jobs come back as "interrupted" from JOBS_FILE.
+    """
+    _TL_STOPPING.set()
+    _TL_EXEC.shutdown(wait=False, cancel_futures=True)
+    for proc in list(_TL_PROCS):
+        proc.terminate()
+    _flush_jobs()
+
 
+threading._register_atexit(_stop_timelapse_jobs)
 
-# Simple in-memory job registry for async timelapse generation
-jobs = {}
+
+# Jobs run the CLI in a child process: the work is ffmpeg and (for the PIL
+# overlay) a forked process pool, neither of which belongs in a threaded web
+# worker. Same interpreter and an absolute path, so it works from any cwd.
+TIMELAPSE_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "timelapse.py")
+STDERR_TAIL_BYTES = 4096
+
+
+def _run_capturing_tail(args: list) -> tuple:
+    """Run ``args`` and return (returncode, last STDERR_TAIL_BYTES of stderr as text).
+
+    stdout is discarded and stderr is read in chunks keeping only the tail, so
+    a chatty ffmpeg run can't grow the web server's memory.
+    """
+    tail = bytearray()
+    with subprocess.Popen(args, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE) as proc:
+        _TL_PROCS.add(proc)
+        try:
+            for chunk in iter(lambda: proc.stderr.read(4096), b""):
+                tail += chunk
+                del tail[:-STDERR_TAIL_BYTES]
+            returncode = proc.wait()
+        finally:
+            _TL_PROCS.discard(proc)
+    return returncode, tail.decode("utf-8", "replace")
 
 
 def _run_timelapse_subprocess(image_dir: str, output_path: str, fps: int, start: str, end: str, no_overlay: bool, job_id: str = None):
-    args = ["python", "src/timelapse.py", image_dir, "-o", output_path, "--fps", str(fps)]
+    args = [sys.executable, TIMELAPSE_SCRIPT, image_dir, "-o", output_path, "--fps", str(fps)]
     if start:
         args += ["--start", start]
     if end:
@@ -466,23 +1159,30 @@ def _run_timelapse_subprocess(image_dir: str, output_path: str, fps: int, start:
     logger.info("Starting timelapse subprocess: %s", " ".join(args))
     start_ts = datetime.utcnow().isoformat() + "Z"
     if job_id:
-        jobs[job_id].update({"status": "running", "started_at": start_ts})
+        _jobs_set(job_id, status="running", started_at=start_ts)
     try:
-        result = subprocess.run(args, capture_output=True, text=True)
-        success = result.returncode == 0
-        logger.info("Timelapse finished rc=%s stdout=%s stderr=%s", result.returncode, result.stdout[:200], result.stderr[:200])
+        returncode, stderr = _run_capturing_tail(args)
+        success = returncode == 0
+        logger.info("Timelapse finished rc=%s stderr=%s", returncode, stderr[-200:])
         if job_id:
-            jobs[job_id].update({
-                "status": "finished" if success else "failed",
-                "finished_at": datetime.utcnow().isoformat() + "Z",
-                "exit_code": result.returncode,
-                "output_path": output_path,
-                "stderr": result.stderr[:200],
-            })
+            _jobs_set(
+                job_id,
+                status="finished" if success else "interrupted" if _TL_STOPPING.is_set() else "failed",
+                finished_at=datetime.utcnow().isoformat() + "Z",
+                exit_code=returncode,
+                output_path=output_path,
+                stderr=stderr[-200:],
+            )
     except Exception as e:
         logger.exception("Failed to run timelapse subprocess")
         if job_id:
-            jobs[job_id].update({"status": "error", "error": str(e)})
+            _jobs_set(job_id, status="error", error=str(e))
+
+
+def _timelapse_output_path(dirpath: Path) -> str:
+    """Absolute path for a new timelapse in ``dirpath`` (string ops only, no resolve())."""
+    timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
+    return os.path.join(os.path.abspath(dirpath), f"timelapse_{timestamp}.mp4")
 
 
 @app.route("/timelapse", methods=["POST"])
@@ -515,50 +1215,49 @@ def timelapse_trigger():
 
     source_dir = _get_source_dir(source) or STORAGE_DIR
 
-    timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
-    output_fname = f"timelapse_{timestamp}.mp4"
-    output_path = str((source_dir / output_fname).resolve())
-
-    # Ensure storage dir exists
-    try:
-        source_dir.mkdir(parents=True, exist_ok=True)
-    except Exception:
-        logger.exception("Failed to create storage dir %s", source_dir)
+    output_path = _timelapse_output_path(source_dir)
+
+    # Special case: async `source=all` -> create a job for every discovered source
+    if run_async and source == 'all':
+        discovered = _discover_sources()
+        if not discovered:
+            return jsonify({"error": "No sources discovered"}), 400
+        job_infos = []
+        for sid, _ in discovered:
+            sid_dir = _get_source_dir(sid) or STORAGE_DIR
+            if not os.path.isdir(sid_dir):
+                logger.error("Storage dir %s does not exist", sid_dir)
+                continue
+            opath = _timelapse_output_path(sid_dir)
+            job_id = str(uuid.uuid4())
+            _jobs_set(
+                job_id,
+                status="queued",
+                created_at=datetime.utcnow().isoformat() + "Z",
+                output_path=opath,
+                source=sid,
+            )
+            _TL_EXEC.submit(_run_timelapse_subprocess, str(sid_dir), opath, fps, start, end, no_overlay, job_id)
+            job_infos.append({"job_id": job_id, "source": sid, "output_path": opath})
+        if not job_infos:
+            return jsonify({"error": "Storage directory not available"}), 500
+        return jsonify({"jobs": job_infos}), 202
+
+    # image dirs are created by the fetcher; creating one here would add an empty source
+    if not os.path.isdir(source_dir):
+        logger.error("Storage dir %s does not exist", source_dir)
         return jsonify({"error": "Storage directory not available"}), 500
 
     if run_async:
-        # Special case: `source=all` -> create an async job for every discovered source
-        if source == 'all':
-            discovered = _discover_sources()
-            if not discovered:
-                return jsonify({"error": "No sources discovered"}), 400
-            job_infos = []
-            for sid, _ in discovered:
-                sid_dir = _get_source_dir(sid) or STORAGE_DIR
-                ts = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
-                ofname = f"timelapse_{ts}.mp4"
-                opath = str((sid_dir / ofname).resolve())
-                job_id = str(uuid.uuid4())
-                jobs[job_id] = {
-                    "status": "queued",
-                    "created_at": datetime.utcnow().isoformat() + "Z",
-                    "output_path": opath,
-                    "source": sid,
-                }
-                thread = threading.Thread(target=_run_timelapse_subprocess, args=(str(sid_dir), opath, fps, start, end, no_overlay, job_id), daemon=True)
-                thread.start()
-                job_infos.append({"job_id": job_id, "source": sid, "output_path": opath})
-            return jsonify({"jobs": job_infos}), 202
-
         job_id = str(uuid.uuid4())
-        jobs[job_id] = {
-            "status": "queued",
-            "created_at": datetime.utcnow().isoformat() + "Z",
-            "output_path": output_path,
-            "source": source,
-        }
-        thread = threading.Thread(target=_run_timelapse_subprocess, args=(str(source_dir), output_path, fps, start, end, no_overlay, job_id), daemon=True)
-        thread.start()
+        _jobs_set(
+            job_id,
+            status="queued",
+            created_at=datetime.utcnow().isoformat() + "Z",
+            output_path=output_path,
+            source=source,
+        )
+        _TL_EXEC.submit(_run_timelapse_subprocess, str(source_dir), output_path, fps, start, end, no_overlay, job_id)
         return jsonify({"job_id": job_id, "status": "queued", "output_path": output_path}), 202
 
     # Run synchronously
@@ -572,43 +1271,104 @@ def timelapse_trigger():
 
 @app.route("/timelapse/<job_id>")
 def timelapse_status(job_id):
-    job = jobs.get(job_id)
+    job = _jobs_get(job_id)
     if not job:
         return jsonify({"error": "Job not found"}), 404
     return jsonify(job)
 
 
+class _ZipSink:
+    """Write-only buffer for ZipFile that hands out what was written so far.
+
+    Chunks are kept as ZipFile wrote them and joined once per drain, so each
+    byte is copied once on its way to the socket.
+    """
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def _month_images(dirpath: Path, month: str) -> list:
+    """Paths of the images captured in ``month``, oldest first.
+
+    Names come from the cached _list_dir() listing, already grouped by
+    month, so a zip request neither scans the directory nor sorts more than
+    the one month.
+    """
+    names = _list_dir(dirpath)["images_by_month"].get(month, ())
+    return [dirpath / name for name in sorted(names)]
+
+
+def _zip_response(files: list, download_name: str):
+    """Stream a zip of ``files`` while it is being built.
+
+    Memory stays at about one file and the first bytes go out immediately.
+    Entries are stored, not deflated: JPEG/PNG/WebP are already compressed.
+
+    Captured frames never change once written, so the archive is identified
+    by its file names alone: a matching If-None-Match gets a 304 before any
+    file is read. The tag is weak because entry timestamps come from mtimes.
+    """
+    etag = hashlib.blake2b("\0".join(p.name for p in files).encode(), digest_size=16).hexdigest()
+    if request.if_none_match.contains_weak(etag):
+        resp = app.response_class(status=304)
+        resp.set_etag(etag, weak=True)
+        return resp
+
+    def generate():
+        sink = _ZipSink()
+        try:
+            with zipfile.ZipFile(sink, "w", zipfile.ZIP_STORED) as zf:
+                for file_path in files:
+                    zf.write(file_path, arcname=file_path.name)
+                    yield sink.drain()
+            # closing the archive writes the central directory
+            yield sink.drain()
+        except Exception:
+            logger.exception("Failed while streaming %s", download_name)
+            raise
+
+    resp = app.response_class(
+        generate(),
+        mimetype="application/zip",
+        headers={
+            "Content-Disposition": f'attachment; filename="{download_name}"',
+            # keep nginx from spooling the whole archive before relaying it
+            "X-Accel-Buffering": "no",
+        },
+        direct_passthrough=True,
+    )
+    resp.set_etag(etag, weak=True)
+    return resp
+
+
 @app.route("/download/zip/<month>")
 def download_zip(month):
     """Download all images from a specific month as a zip file.
 
     month format: YYYYMM (e.g., 202501)
     """
-    if not month or len(month) != 6 or not month.isdigit():
+    if not _MONTH_RE.match(month):
         return jsonify({"error": "Invalid month format. Use YYYYMM"}), 400
 
     try:
-        # Collect all files that start with this month
-        files = [
-            p for p in STORAGE_DIR.iterdir()
-            if p.is_file() and p.name.startswith(month) and p.suffix.lower() in (".jpg", ".jpeg", ".png", ".webp")
-        ]
+        files = _month_images(STORAGE_DIR, month)
         if not files:
             return jsonify({"error": "No images found for this month"}), 404
 
-        # Create zip in memory
-        zip_buffer = io.BytesIO()
-        with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zf:
-            for file_path in sorted(files):
-                zf.write(file_path, arcname=file_path.name)
-
-        zip_buffer.seek(0)
-        return send_file(
-            zip_buffer,
-            mimetype="application/zip",
-            as_attachment=True,
-            download_name=f"images_{month}.zip"
-        )
+        return _zip_response(files, f"images_{month}.zip")
     except Exception as e:
         logger.exception("Failed to create zip for month %s", month)
         return jsonify({"error": str(e)}), 500
@@ -617,7 +1377,7 @@ def download_zip(month):
 @app.route("/source/<source>/download/zip/<month>")
 def download_zip_source(source, month):
     """Download all images for a month from a specific source as a zip."""
-    if not month or len(month) != 6 or not month.isdigit():
+    if not _MONTH_RE.match(month):
         return jsonify({"error": "Invalid month format. Use YYYYMM"}), 400
 
     dirpath = _get_source_dir(source)
@@ -625,25 +1385,11 @@ def download_zip_source(source, month):
         return jsonify({"error": "Source not found"}), 404
 
     try:
-        files = [
-            p for p in dirpath.iterdir()
-            if p.is_file() and p.name.startswith(month) and p.suffix.lower() in (".jpg", ".jpeg", ".png", ".webp")
-        ]
+        files = _month_images(dirpath, month)
         if not files:
             return jsonify({"error": "No images found for this month"}), 404
 
-        zip_buffer = io.BytesIO()
-        with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zf:
-            for file_path in sorted(files):
-                zf.write(file_path, arcname=file_path.name)
-
-        zip_buffer.seek(0)
-        return send_file(
-            zip_buffer,
-            mimetype="application/zip",
-            as_attachment=True,
-            download_name=f"images_{source}_{month}.zip"
-        )
+        return _zip_response(files, f"images_{source}_{month}.zip")
     except Exception as e:
         logger.exception("Failed to create zip for month %s on source %s", month, source)
         return jsonify({"error": str(e)}), 500
@@ -2,6 +2,8 @@ import sys
 from datetime import datetime
 from pathlib import Path
 
+import pytest
+
 sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
 
 import fetcher
@@ -25,3 +27,143 @@ def test_guess_extension_from_content_type():
 def test_guess_extension_from_url():
     r = DummyResp({})
     assert fetcher.guess_extension(r, "http://example.com/foo.jpg?x=1") == ".jpg"
+
+
+def test_save_image_writes_chunks(tmp_path):
+    dest = tmp_path / "20200102_030405.jpg"
+    assert fetcher.save_image([b"ab", b"", b"cd"], dest) == 4
+    assert dest.read_bytes() == b"abcd"
+    assert not (tmp_path / "20200102_030405.jpg.tmp").exists()
+
+
+def test_save_image_rejects_empty_body(tmp_path):
+    dest = tmp_path / "empty.jpg"
+    with pytest.raises(ValueError):
+        fetcher.save_image([b""], dest)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_rotate_storage_by_count_and_age(tmp_path):
+    import os
+    import time
+
+    names = ["20200101_000000.jpg", "20200102_000000.jpg", "20200103_000000.jpg", "20200104_000000.jpg"]
+    for n in names:
+        (tmp_path / n).write_bytes(b"x")
+    (tmp_path / "latest").symlink_to(names[-1])
+    old = time.time() - 10 * 86400
+    os.utime(tmp_path / names[1], (old, old))
+
+    fetcher.rotate_storage(tmp_path, max_files=3, max_age_days=5)
+
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["20200103_000000.jpg", "20200104_000000.jpg", "latest"]
+
+
+def test_rotate_storage_noop_without_limits(tmp_path):
+    (tmp_path / "20200101_000000.jpg").write_bytes(b"x")
+    fetcher.rotate_storage(tmp_path / "missing")
+    fetcher.rotate_storage(tmp_path)
+    assert (tmp_path / "20200101_000000.jpg").exists()
+
+
+def test_update_latest_replaces_link(tmp_path):
+    first = tmp_path / "20200101_000000.jpg"
+    second = tmp_path / "20200102_000000.jpg"
+    first.write_bytes(b"1")
+    second.write_bytes(b"2")
+    fetcher.update_latest(tmp_path, first)
+    fetcher.update_latest(tmp_path, second)
+    assert (tmp_path / "latest").read_bytes() == b"2"
+
+
+def test_backoff_delay_has_bounded_jitter():
+    for attempt in range(1, 4):
+        base = 2.0 ** attempt
+        delay = fetcher.backoff_delay(attempt, 2.0)
+        assert base <= delay <= min(base * 1.1, fetcher.MAX_BACKOFF_SECONDS)
+    assert fetcher.backoff_delay(50, 2.0) == fetcher.MAX_BACKOFF_SECONDS
+
+
+def test_slugify_id_keeps_unicode_letters():
+    assert fetcher.slugify_id("hurumbrygge.info:8080") == "hurumbrygge_info_8080"
+    assert fetcher.slugify_id("Libakkløkka-cam_1") == "Libakkløkka-cam_1"
+
+
+class FakeResp(DummyResp):
+    def __init__(self, status_code, headers=None):
+        super().__init__(headers or {})
+        self.status_code = status_code
+
+    def close(self):
+        pass
+
+
+class FakeSession:
+    def __init__(self, resp):
+        self.resp = resp
+        self.sent_headers = None
+
+    def get(self, url, **kwargs):
+        self.sent_headers = kwargs.get("headers")
+        return self.resp
+
+
+def test_try_fetch_returns_not_modified_on_304():
+    fetcher.remember_validators("http://cam/a.jpg", DummyResp({"ETag": '"abc"'}))
+    headers = fetcher.conditional_headers("http://cam/a.jpg")
+    assert headers == {"If-None-Match": '"abc"'}
+    session = FakeSession(FakeResp(304))
+    resp = fetcher.try_fetch("http://cam/a.jpg", timeout=1, retries=0, backoff=1, session=session, headers=headers)
+    assert resp is fetcher.NOT_MODIFIED
+    assert session.sent_headers == headers
+
+
+def test_save_image_removes_partial_tmp_on_read_error(tmp_path):
+    def chunks():
+        yield b"partial"
+        raise fetcher.requests.exceptions.ChunkedEncodingError("connection reset")
+
+    dest = tmp_path / "20200102_030405.jpg"
+    with pytest.raises(fetcher.requests.exceptions.ChunkedEncodingError):
+        fetcher.save_image(chunks(), dest)
+    assert list(tmp_path.iterdir()) == []
+
+
+class BodyResp(FakeResp):
+    def __init__(self, body):
+        super().__init__(200, {"content-type": "image/jpeg"})
+        self.body = body
+
+    def iter_content(self, chunk_size=1):
+        for chunk in self.body:
+            if isinstance(chunk, Exception):
+                raise chunk
+            yield chunk
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class SequenceSession:
+    def __init__(self, *resps):
+        self.resps = list(resps)
+
+    def get(self, url, **kwargs):
+        return self.resps.pop(0)
+
+
+def test_process_source_retries_failed_and_empty_bodies(tmp_path, monkeypatch):
+    monkeypatch.setattr(fetcher.time, "sleep", lambda s: None)
+    monkeypatch.setattr(fetcher, "SESSION", SequenceSession(
+        BodyResp([b"half", fetcher.requests.exceptions.ChunkedEncodingError("reset")]),
+        BodyResp([b""]),
+        BodyResp([b"full", b"image"]),
+    ))
+    fetcher.process_source({"id": "cam", "url": "http://cam/a.jpg", "dir": tmp_path})
+    saved = [p for p in tmp_path.iterdir() if p.name != "latest"]
+    assert len(saved) == 1 and saved[0].suffix == ".jpg"
+    assert saved[0].read_bytes() == b"fullimage"
+    assert (tmp_path / "latest").read_bytes() == b"fullimage"
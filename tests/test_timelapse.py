@@ -0,0 +1,82 @@
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+import timelapse
+
+
+def test_update_latest_timelapse_swaps_link(tmp_path):
+    for name in ("timelapse_1.mp4", "timelapse_2.mp4"):
+        (tmp_path / name).write_bytes(b"mp4")
+        timelapse.update_latest_timelapse(tmp_path / name)
+    assert os.readlink(tmp_path / timelapse.LATEST_TIMELAPSE_LINK) == "timelapse_2.mp4"
+    assert not os.path.lexists(tmp_path / (timelapse.LATEST_TIMELAPSE_LINK + ".tmp"))
+
+
+def _write_image(path, size, color="red"):
+    from PIL import Image
+
+    Image.new("RGB", size, color).save(path)
+
+
+def test_label_one_returns_rgb_frame_of_video_size(tmp_path):
+    same = tmp_path / "20250101_120000.jpg"
+    other = tmp_path / "20250101_130000.png"
+    _write_image(same, (64, 48))
+    _write_image(other, (100, 30))
+    for path in (same, other):
+        assert len(timelapse._label_one((path, (64, 48)))) == 64 * 48 * 3
+    assert timelapse._label_one((tmp_path / "missing.jpg", (64, 48))) is None
+
+
+def test_write_concat_file_adds_filename_metadata(tmp_path):
+    images = [tmp_path / "20250101_120000.jpg", tmp_path / "20250101_130000.jpg"]
+    plain = Path(timelapse._write_concat_file(images, 25))
+    tagged = Path(timelapse._write_concat_file(images, 25, with_filename_metadata=True))
+    try:
+        assert "file_packet_metadata" not in plain.read_text()
+        assert tagged.read_text().splitlines() == [
+            f"file '{images[0]}'",
+            "file_packet_metadata filename=20250101_120000.jpg",
+            "duration 0.04",
+            f"file '{images[1]}'",
+            "file_packet_metadata filename=20250101_130000.jpg",
+            "duration 0.04",
+        ]
+    finally:
+        plain.unlink()
+        tagged.unlink()
+
+
+def test_encoder_args_follow_settings(monkeypatch):
+    monkeypatch.setattr(timelapse, "VIDEO_ENCODER", "libx264")
+    monkeypatch.setattr(timelapse, "X264_PRESET", "slow")
+    assert timelapse._encoder_args() == ["-c:v", "libx264", "-preset", "slow"]
+    monkeypatch.setattr(timelapse, "VIDEO_ENCODER", "h264_qsv")
+    assert timelapse._encoder_args() == ["-c:v", "h264_qsv", "-global_quality", "23"]
+    monkeypatch.setattr(timelapse, "VIDEO_ENCODER", "auto")
+    monkeypatch.setattr(timelapse, "_detect_hw_encoder", lambda: None)
+    assert timelapse._encoder_args()[:2] == ["-c:v", "libx264"]
+
+
+def test_pil_overlay_pipes_every_frame_to_ffmpeg(tmp_path, monkeypatch):
+    # stub ffmpeg: writes the number of stdin bytes to the output path
+    bindir = tmp_path / "bin"
+    bindir.mkdir()
+    stub = bindir / "ffmpeg"
+    stub.write_text('#!/bin/sh\nfor last; do :; done\nwc -c > "$last"\n')
+    stub.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{bindir}{os.pathsep}{os.environ['PATH']}")
+    monkeypatch.setattr(timelapse, "VIDEO_ENCODER", "libx264")
+    # one frame per batch
+    monkeypatch.setattr(timelapse, "FRAME_BUFFER_BYTES", 1)
+
+    images = []
+    for i, size in enumerate([(32, 16), (32, 16), (20, 20)]):
+        images.append(tmp_path / f"2025010{i + 1}_120000.jpg")
+        _write_image(images[-1], size)
+    output = tmp_path / "out.mp4"
+    assert timelapse._generate_with_pil_overlay(images, output, 30)
+    assert int(output.read_text()) == 3 * 32 * 16 * 3
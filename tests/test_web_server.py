@@ -0,0 +1,506 @@
+import os
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+import web_server
+
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    for cam in ("cam1", "cam2"):
+        images = tmp_path / cam / "images"
+        images.mkdir(parents=True)
+        for name in ("20250101_120000.jpg", "20250115_120000.jpg", "20250201_120000.jpg"):
+            (images / name).write_bytes(b"img")
+        (images / "latest").symlink_to("20250201_120000.jpg")
+    monkeypatch.setattr(web_server, "STORAGE_ROOT", tmp_path)
+    monkeypatch.setattr(web_server, "STORAGE_DIR", tmp_path / "cam1" / "images")
+    return tmp_path
+
+
+@pytest.fixture
+def client():
+    return web_server.app.test_client()
+
+
+def test_discover_sources_prefers_images_subdir(storage):
+    assert web_server._discover_sources() == [
+        ("cam1", storage / "cam1" / "images"),
+        ("cam2", storage / "cam2" / "images"),
+    ]
+
+
+def test_source_list_is_newest_first(storage, client):
+    data = client.get("/source/cam2/list").get_json()
+    assert data["images"] == ["20250201_120000.jpg", "20250115_120000.jpg", "20250101_120000.jpg"]
+
+
+def test_list_is_revalidated_with_etag(storage, client):
+    resp = client.get("/source/cam2/list")
+    again = client.get("/source/cam2/list", headers={"If-None-Match": resp.headers["ETag"]})
+    assert again.status_code == 304 and again.data == b""
+
+
+def test_index_shows_sources_and_latest_timelapse(storage, client):
+    (storage / "cam1" / "images" / "timelapse_20250201_000000.mp4").write_bytes(b"mp4")
+    html = client.get("/").get_data(as_text=True)
+    assert "Camera: cam2" in html
+    assert "timelapse_20250201_000000.mp4" in html
+
+
+def test_list_cache_sees_new_files(storage, client):
+    images = storage / "cam1" / "images"
+    assert client.get("/list").get_json()["count"] == 3
+    (images / "20250301_120000.jpg").write_bytes(b"img")
+    data = client.get("/list").get_json()
+    assert data["count"] == 4
+    assert data["images"][0] == "20250301_120000.jpg"
+
+
+def test_zip_download_streams_month(storage, client):
+    import io
+    import zipfile
+
+    resp = client.get("/source/cam2/download/zip/202501")
+    assert resp.status_code == 200
+    assert resp.headers["X-Accel-Buffering"] == "no"
+    with zipfile.ZipFile(io.BytesIO(resp.data)) as zf:
+        assert zf.namelist() == ["20250101_120000.jpg", "20250115_120000.jpg"]
+        assert zf.read("20250101_120000.jpg") == b"img"
+    assert client.get("/source/cam2/download/zip/202503").status_code == 404
+    assert client.get("/source/cam2/download/zip/٢٠٢٥٠١").status_code == 400
+    assert client.get("/download/zip/20250").status_code == 400
+    again = client.get("/source/cam2/download/zip/202501", headers={"If-None-Match": resp.headers["ETag"]})
+    assert again.status_code == 304 and again.data == b""
+    (storage / "cam2" / "images" / "20250120_120000.jpg").write_bytes(b"img")
+    changed = client.get("/source/cam2/download/zip/202501", headers={"If-None-Match": resp.headers["ETag"]})
+    assert changed.status_code == 200
+
+
+def test_discover_sources_falls_back_without_subdirs(tmp_path, monkeypatch):
+    (tmp_path / "20250101_120000.jpg").write_bytes(b"img")
+    monkeypatch.setattr(web_server, "STORAGE_ROOT", tmp_path)
+    monkeypatch.setattr(web_server, "STORAGE_DIR", tmp_path)
+    assert web_server._discover_sources() == [(tmp_path.name, tmp_path)]
+
+
+def test_timelapse_does_not_create_missing_storage_dir(tmp_path, monkeypatch, client):
+    monkeypatch.setattr(web_server, "STORAGE_ROOT", tmp_path)
+    monkeypatch.setattr(web_server, "STORAGE_DIR", tmp_path / "images")
+    resp = client.post("/timelapse", json={})
+    assert resp.status_code == 500
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_timelapse_for_all_sources_without_storage_dir(storage, client, monkeypatch):
+    monkeypatch.setattr(web_server, "STORAGE_DIR", storage / "images")
+    monkeypatch.setattr(web_server, "_JOBS", web_server.OrderedDict())
+    submitted = []
+    monkeypatch.setattr(web_server._TL_EXEC, "submit", lambda fn, *args: submitted.append(args[0]))
+    resp = client.post("/timelapse", json={"source": "all", "async": True})
+    assert resp.status_code == 202
+    assert [job["source"] for job in resp.get_json()["jobs"]] == ["cam1", "cam2"]
+    assert submitted == [str(storage / "cam1" / "images"), str(storage / "cam2" / "images")]
+    assert not (storage / "images").exists()
+
+
+def test_latest_timelapse_link_is_used_and_not_listed(storage, client):
+    images = storage / "cam1" / "images"
+    (images / "timelapse_20250101_000000.mp4").write_bytes(b"old")
+    (images / "timelapse_20250201_000000.mp4").write_bytes(b"new")
+    (images / "latest_timelapse.mp4").symlink_to("timelapse_20250101_000000.mp4")
+    (images / "latest_timelapse.mp4.tmp").symlink_to("timelapse_20250201_000000.mp4")
+    listed = client.get("/list").get_json()["images"]
+    assert "latest_timelapse.mp4" not in listed and "latest_timelapse.mp4.tmp" not in listed
+    html = client.get("/").get_data(as_text=True)
+    assert "Latest: <a href=\"/source/cam1/download/timelapse_20250101_000000.mp4\"" in html
+
+
+def test_jobs_registry_is_bounded(monkeypatch):
+    monkeypatch.setattr(web_server, "_JOBS", web_server.OrderedDict())
+    monkeypatch.setattr(web_server, "_JOBS_MAX", 2)
+    for jid in ("a", "b", "c"):
+        web_server._jobs_set(jid, status="queued")
+    web_server._jobs_set("b", status="running")
+    web_server._jobs_set("d", status="queued")
+    assert web_server._jobs_get("a") is None
+    assert web_server._jobs_get("c") is None
+    # finished jobs go before older ones still in progress
+    web_server._jobs_set("d", status="finished")
+    web_server._jobs_set("e", status="queued")
+    assert web_server._jobs_get("d") is None
+    assert web_server._jobs_get("b")["status"] == "running"
+    job = web_server._jobs_get("b")
+    job["status"] = "mutated"
+    assert web_server._jobs_get("b")["status"] == "running"
+
+
+def test_exit_hook_cancels_queued_and_terminates_running_jobs(tmp_path, monkeypatch):
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+
+    script = tmp_path / "slow.py"
+    script.write_text("import time\ntime.sleep(30)\n")
+    monkeypatch.setattr(web_server, "TIMELAPSE_SCRIPT", str(script))
+    monkeypatch.setattr(web_server, "_JOBS", web_server.OrderedDict())
+    monkeypatch.setattr(web_server, "_TL_EXEC", ThreadPoolExecutor(max_workers=1))
+    monkeypatch.setattr(web_server, "_TL_PROCS", set())
+    monkeypatch.setattr(web_server, "_TL_STOPPING", threading.Event())
+    futures = []
+    for job_id in ("running", "queued"):
+        web_server._jobs_set(job_id, status="queued")
+        futures.append(web_server._TL_EXEC.submit(
+            web_server._run_timelapse_subprocess, str(tmp_path), str(tmp_path / "out.mp4"), 30, None, None, False, job_id))
+    deadline = time.monotonic() + 5
+    while not web_server._TL_PROCS and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    web_server._stop_timelapse_jobs()
+    futures[0].result(timeout=5)
+    assert futures[1].cancelled()
+    assert web_server._jobs_get("running")["status"] == "interrupted"
+    assert web_server._jobs_get("queued")["status"] == "queued"
+
+
+def test_health_reports_queue_depth(client, monkeypatch):
+    monkeypatch.setattr(web_server, "_JOBS", web_server.OrderedDict())
+    web_server._jobs_set("a", status="queued")
+    web_server._jobs_set("b", status="running")
+    assert client.get("/health").get_json() == {"status": "ok", "queue_depth": 1}
+
+
+def test_latest_revalidates_and_index_uses_mtime_token(storage, client):
+    target = storage / "cam2" / "images" / "20250201_120000.jpg"
+    os.utime(target, (1700000000, 1700000000))
+    resp = client.get("/source/cam2/latest")
+    assert resp.status_code == 200 and resp.headers["ETag"]
+    again = client.get("/source/cam2/latest", headers={"If-None-Match": resp.headers["ETag"]})
+    assert again.status_code == 304 and again.data == b""
+    html = client.get("/").get_data(as_text=True)
+    assert '/source/cam2/latest?v=1700000000"' in html
+
+
+def test_latest_watcher_ignores_reads_of_latest(storage, monkeypatch):
+    pytest.importorskip("watchdog")
+    images = storage / "cam1" / "images"
+    # the fetcher's fallback where symlinks aren't available
+    (images / "latest").unlink()
+    os.link(images / "20250201_120000.jpg", images / "latest")
+    monkeypatch.setattr(web_server, "_LATEST_PATH", None)
+    assert web_server._start_latest_watcher()
+    resolved = []
+    monkeypatch.setattr(web_server, "_resolve_latest", lambda: resolved.append(1))
+
+    for _ in range(3):
+        (images / "latest").read_bytes()
+    time.sleep(0.3)
+    assert resolved == []
+
+    (images / "latest").unlink()
+    (images / "latest").symlink_to("20250115_120000.jpg")
+    deadline = time.monotonic() + 5
+    while not resolved and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert resolved
+
+
+def test_latest_source_falls_back_when_link_dangles(storage, client):
+    images = storage / "cam2" / "images"
+    (images / "latest").unlink()
+    (images / "latest").symlink_to("19990101_000000.jpg")
+    (images / "20250301_120000.jpg").write_bytes(b"newest")
+    (images / "timelapse_20250301_000000.mp4").write_bytes(b"mp4")
+    resp = client.get("/source/cam2/latest")
+    assert resp.status_code == 200 and resp.data == b"newest"
+
+
+def test_subprocess_stderr_capture_keeps_only_tail():
+    code = "import sys; sys.stderr.write('x' * 100000 + 'END'); sys.exit(3)"
+    returncode, stderr = web_server._run_capturing_tail([sys.executable, "-c", code])
+    assert returncode == 3
+    assert len(stderr) == web_server.STDERR_TAIL_BYTES and stderr.endswith("END")
+
+
+def test_handlers_share_one_scan_per_directory(storage, client, monkeypatch):
+    # let the racy-mtime guard trust the scans made below
+    for cam in ("cam1", "cam2"):
+        os.utime(storage / cam / "images", (1700000000, 1700000000))
+    web_server._LISTING_CACHE.clear()
+    scanned = []
+    real_scandir = os.scandir
+
+    def counting_scandir(path):
+        scanned.append(str(path))
+        return real_scandir(path)
+
+    monkeypatch.setattr(web_server.os, "scandir", counting_scandir)
+    client.get("/")
+    for url in ("/list", "/source/cam2/list", "/source/cam2/latest",
+                "/download/zip/202501", "/source/cam2/download/zip/202501"):
+        assert client.get(url).status_code == 200
+    image_dir_scans = [p for p in scanned if p.endswith("images")]
+    assert sorted(image_dir_scans) == [str(storage / "cam1" / "images"), str(storage / "cam2" / "images")]
+
+
+def test_latest_mtime_endpoint(storage, client):
+    web_server._LATEST_MTIME_CACHE.clear()
+    os.utime(storage / "cam1" / "images" / "20250201_120000.jpg", (1700000000, 1700000000))
+    assert client.get("/api/latest-mtime?source=cam1").get_json() == {"mtime": 1700000000}
+    assert client.get("/api/latest-mtime?source=nope").status_code == 404
+    html = client.get("/").get_data(as_text=True)
+    assert html.count('class="auto-refresh"') == 2
+
+
+def test_concurrent_listing_misses_share_one_scan(storage, monkeypatch):
+    import threading
+
+    web_server._LISTING_CACHE.clear()
+    dirpath = storage / "cam1" / "images"
+    calls = []
+    real_scan = web_server._scan_dir
+
+    def slow_scan(path):
+        calls.append(path)
+        time.sleep(0.05)
+        return real_scan(path)
+
+    monkeypatch.setattr(web_server, "_scan_dir", slow_scan)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(web_server._list_dir(dirpath))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(calls) == 1
+    assert all(r is results[0] for r in results)
+
+
+def test_downloads_hand_the_file_to_the_server_file_wrapper(storage, client):
+    # gunicorn's wsgi.file_wrapper turns this into sendfile(2)
+    wrapped = []
+
+    class FileWrapper:
+        def __init__(self, f, blksize=8192):
+            wrapped.append(f.name)
+            self.f = f
+
+        def __iter__(self):
+            return iter(lambda: self.f.read(8192), b"")
+
+        def close(self):
+            self.f.close()
+
+    env = {"wsgi.file_wrapper": FileWrapper}
+    for url in ("/source/cam2/download/20250101_120000.jpg", "/source/cam2/latest"):
+        resp = client.get(url, environ_base=env)
+        assert resp.status_code == 200 and resp.data == b"img"
+        resp.close()
+    assert len(wrapped) == 2
+
+
+def test_jobs_survive_restart_via_jobs_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(web_server, "JOBS_FILE", str(tmp_path / "jobs.json"))
+    monkeypatch.setattr(web_server, "JOBS_SAVE_DELAY", 60)
+    monkeypatch.setattr(web_server, "_JOBS", web_server.OrderedDict())
+    web_server._jobs_set("done", status="finished", exit_code=0)
+    web_server._jobs_set("busy", status="running")
+    # the write is deferred to a timer, not done on the calling thread
+    assert not (tmp_path / "jobs.json").exists()
+    web_server._flush_jobs()
+
+    monkeypatch.setattr(web_server, "_JOBS", web_server.OrderedDict())
+    web_server._load_jobs()
+    assert web_server._jobs_get("done") == {"status": "finished", "exit_code": 0}
+    assert web_server._jobs_get("busy")["status"] == "interrupted"
+
+
+def test_load_jobs_ignores_malformed_jobs_file(tmp_path, monkeypatch):
+    jobs_file = tmp_path / "jobs.json"
+    monkeypatch.setattr(web_server, "JOBS_FILE", str(jobs_file))
+    monkeypatch.setattr(web_server, "_JOBS", web_server.OrderedDict())
+    for payload in ("[]", '"jobs"', "{not json"):
+        jobs_file.write_text(payload)
+        web_server._load_jobs()
+        assert not web_server._JOBS
+    jobs_file.write_text('{"bad": 1, "ok": {"status": "finished"}}')
+    web_server._load_jobs()
+    assert list(web_server._JOBS) == ["ok"]
+
+
+def test_index_escapes_source_ids(tmp_path, monkeypatch, client):
+    images = tmp_path / "cam<b>" / "images"
+    images.mkdir(parents=True)
+    (images / "20250101_120000.jpg").write_bytes(b"img")
+    monkeypatch.setattr(web_server, "STORAGE_ROOT", tmp_path)
+    monkeypatch.setattr(web_server, "STORAGE_DIR", images)
+    html = client.get("/").get_data(as_text=True)
+    assert "Camera: cam&lt;b&gt;" in html and "cam<b>" not in html
+
+
+def test_revalidation_short_circuit_matches_send_file_etag(storage, client, monkeypatch):
+    url = "/source/cam2/download/20250101_120000.jpg"
+    first = client.get(url)
+    etag = first.headers["ETag"]
+
+    def no_send_file(*args, **kwargs):
+        raise AssertionError("send_file called for a matching ETag")
+
+    monkeypatch.setattr(web_server, "send_file", no_send_file)
+    again = client.get(url, headers={"If-None-Match": etag})
+    assert again.status_code == 304
+    assert again.headers["ETag"] == etag
+    assert again.headers["Cache-Control"] == first.headers["Cache-Control"]
+
+
+def test_range_requests_use_the_file_wrapper_under_gunicorn(storage, client):
+    video = storage / "cam2" / "images" / "timelapse_20250101_000000.mp4"
+    video.write_bytes(b"0123456789")
+    wrapped = []
+
+    class FileWrapper:
+        def __init__(self, filelike, blksize=8192):
+            wrapped.append((filelike.tell(), os.fstat(filelike.fileno()).st_ino))
+            self.filelike = filelike
+            if len(wrapped) == 1:
+                # a new timelapse replaces the file while the request is served
+                replacement = video.with_name("replacement.mp4")
+                replacement.write_bytes(b"abcdefghij")
+                os.replace(replacement, video)
+
+        # like gunicorn's: its own iterator
+        def __iter__(self):
+            return self
+
+        def __next__(self):
+            data = self.filelike.read(8192)
+            if not data:
+                raise StopIteration
+            return data
+
+        def close(self):
+            self.filelike.close()
+
+    ino = video.stat().st_ino
+    env = {"wsgi.file_wrapper": FileWrapper, "SERVER_SOFTWARE": "gunicorn/23.0.0"}
+    resp = client.get("/source/cam2/download/timelapse_20250101_000000.mp4",
+                      headers={"Range": "bytes=4-6"}, environ_base=env)
+    assert resp.status_code == 206
+    assert resp.headers["Content-Length"] == "3"
+    assert resp.headers["Content-Range"] == "bytes 4-6/10"
+    # send_file's own wrapper at offset 0, then the same file re-seeked
+    assert wrapped == [(0, ino), (4, ino)]
+    resp.close()
+
+    plain = client.get("/source/cam2/download/timelapse_20250101_000000.mp4", headers={"Range": "bytes=4-6"})
+    assert plain.status_code == 206 and plain.data == b"efg"
+
+
+def test_download_rejects_traversal_and_404s_missing(storage, client):
+    assert client.get("/source/cam2/download/..%2F..%2Fetc%2Fpasswd").status_code in (400, 404)
+    assert client.get("/source/cam2/download/.hidden").status_code == 400
+    assert client.get("/source/cam2/download/..%5Cimages").status_code == 400
+    assert client.get("/source/cam2/download/20990101_000000.jpg").status_code == 404
+    assert client.get("/download/20990101_000000.jpg").status_code == 404
+
+
+def test_latest_timelapse_fallback_picks_newest_mtime(storage):
+    images = storage / "cam2" / "images"
+    for name, mtime in (("a.mp4", 1700000300), ("timelapse_20250101_000000.mp4", 1700000100), ("b.mp4", 1700000200)):
+        (images / name).write_bytes(b"mp4")
+        os.utime(images / name, (mtime, mtime))
+    assert web_server._scan_dir(images)["latest_timelapse"] == "a.mp4"
+
+    # a link to a deleted or foreign video falls back to the same scan
+    for target in ("timelapse_20240101_000000.mp4", "../../cam1/images/timelapse_x.mp4"):
+        (images / "latest_timelapse.mp4").unlink(missing_ok=True)
+        (images / "latest_timelapse.mp4").symlink_to(target)
+        assert web_server._scan_dir(images)["latest_timelapse"] == "a.mp4"
+
+
+def test_listing_warm_up_collapses_bursts(storage, monkeypatch):
+    monkeypatch.setattr(web_server, "LISTING_WARM_DELAY", 0.05)
+    scans = []
+    monkeypatch.setattr(web_server, "_list_dir", lambda path: scans.append(path))
+    dirpath = storage / "cam1" / "images"
+    for _ in range(5):
+        web_server._schedule_warm_listing(dirpath)
+    time.sleep(0.3)
+    assert scans == [dirpath]
+    web_server._schedule_warm_listing(dirpath)
+    time.sleep(0.3)
+    assert scans == [dirpath, dirpath]
+
+
+def test_listing_warmer_covers_sources_created_later(tmp_path, monkeypatch):
+    pytest.importorskip("watchdog")
+    monkeypatch.setattr(web_server, "STORAGE_ROOT", tmp_path)
+    monkeypatch.setattr(web_server, "STORAGE_DIR", tmp_path / "images")
+    monkeypatch.setattr(web_server, "_LATEST_MTIMES", {})
+    warmed = []
+    monkeypatch.setattr(web_server, "_schedule_warm_listing", warmed.append)
+    assert web_server._start_listing_warmer()
+
+    # the fetcher creates its directory only after the web server started
+    images = tmp_path / "cam3" / "images"
+    images.mkdir(parents=True)
+    (images / "20250101_120000.jpg").write_bytes(b"img")
+    (images / "latest").symlink_to("20250101_120000.jpg")
+    deadline = time.monotonic() + 5
+    while "cam3" not in web_server._LATEST_MTIMES and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert "cam3" in web_server._LATEST_MTIMES
+    assert images in warmed
+
+
+def test_events_stream_pushes_latest_changes(storage, client, monkeypatch):
+    import threading
+
+    monkeypatch.setattr(web_server, "_LISTING_WARMER", True)
+    monkeypatch.setattr(web_server, "_LATEST_MTIMES", {})
+    monkeypatch.setattr(web_server, "_SSE_SLOTS", threading.BoundedSemaphore(1))
+    monkeypatch.setattr(web_server, "SSE_MAX_SECONDS", 0.5)
+    monkeypatch.setattr(web_server, "SSE_KEEPALIVE_SECONDS", 0.1)
+    os.utime(storage / "cam1" / "images" / "20250201_120000.jpg", (1700000000, 1700000000))
+
+    # a HEAD never iterates the body but must still give its slot back
+    for _ in range(2):
+        head = client.head("/events")
+        assert head.status_code == 200
+        head.close()
+
+    resp = client.get("/events", buffered=False)
+    assert resp.status_code == 200 and resp.mimetype == "text/event-stream"
+    # the only slot is taken
+    assert client.get("/events").status_code == 503
+    chunks = iter(resp.response)
+    assert next(chunks) == b"retry: 5000\n\n"
+    threading.Timer(0.05, web_server._notify_latest, ("cam1", storage / "cam1" / "images")).start()
+    body = b"".join(chunks)
+    assert b'data: {"source": "cam1", "mtime": 1700000000}\n\n' in body
+    resp.close()
+    assert web_server._SSE_SLOTS.acquire(blocking=False)
+
+
+def test_list_returns_images_newest_first(tmp_path, monkeypatch):
+    for name in ("20250101_120000.jpg", "20250201_120000.jpg"):
+        (tmp_path / name).write_bytes(b"img")
+    (tmp_path / "latest").symlink_to("20250201_120000.jpg")
+    monkeypatch.setattr(web_server, "STORAGE_DIR", tmp_path)
+    resp = web_server.app.test_client().get("/list")
+    assert resp.status_code == 200
+    assert resp.get_json() == {"images": ["20250201_120000.jpg", "20250101_120000.jpg"], "count": 2}
+
+
+def test_orjson_provider_honours_sort_keys():
+    pytest.importorskip("orjson")
+    provider = web_server._OrjsonProvider(web_server.app)
+    assert provider.dumps({"b": 1, "a": 2}) == '{"a":2,"b":1}'
+    with web_server.app.app_context():
+        assert provider.response(b=1, a=2).get_data() == b'{"a":2,"b":1}'
+    provider.sort_keys = False
+    assert provider.dumps({"b": 1, "a": 2}) == '{"b":1,"a":2}'